@@ -1,19 +1,76 @@
+import json
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User as Profile
 from django.contrib.auth.models import Group
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+from django.utils.text import Truncator
 from .models import User, Client, Contract, Event
 from .forms import CustomUserCreation, UserChangeForm
+from .search import search_clients
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator counting with the planner estimate of PostgreSQL
+    (EXPLAIN, which reads no row) above 'exact_count_limit' rows, an exact
+    COUNT(*) reads every row of the filtered table. Other databases count.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist without exact counts, the total row count isn't shown."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+
+
+class BoundedInlineFormSet(BaseInlineFormSet):
+    """Only the 'max_rows' latest rows of the inline, the others are edited from their own page."""
+    max_rows = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            self._queryset = super().get_queryset().order_by('-date_created', '-id')[:self.max_rows]
+        return self._queryset
 
 
 class ContractInline(admin.TabularInline):
     fields = ('status', 'amount', 'payment_due', 'sales_contact', 'id')
     model = Contract
+    formset = BoundedInlineFormSet
+    autocomplete_fields = ('sales_contact',)
+    show_change_link = True
+    verbose_name_plural = f'Contracts ({BoundedInlineFormSet.max_rows} latest)'
     extra = 0
 
 
 class EventInline(admin.TabularInline):
     model = Event
+    formset = BoundedInlineFormSet
+    autocomplete_fields = ('client', 'support_contact')
+    show_change_link = True
     extra = 0
 
 
@@ -22,6 +79,7 @@ class UserAdmin(BaseUserAdmin):
     add_form = CustomUserCreation
     list_display = ('username', 'role', 'is_admin', 'is_staff', 'id')
     list_filter = ('is_admin',)
+    search_fields = ('username',)
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
         ('Personal info', {'fields': ('role',)}),
@@ -40,18 +98,60 @@ admin.site.unregister(Group)
 
 
 @admin.register(Contract)
-class ContractAdmin(admin.ModelAdmin):
+class ContractAdmin(LargeTableAdmin):
     list_display = ('client', 'date_created', 'amount', 'status', 'payment_due', 'sales_contact', 'id')
+    list_select_related = ('client', 'sales_contact')
+    autocomplete_fields = ('client', 'sales_contact')
+    search_fields = ('client__email',)
+    search_help_text = 'Contract ID or exact client email.'
     inlines = [EventInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(id=int(term)), False
+        return queryset.filter(client__email=term), False
+
+
+class RankedChangeList(ChangeList):
+    """Search results by 'search_rank' (see search_clients) unless a column is sorted."""
+
+    def get_ordering(self, request, queryset):
+        if 'search_rank' in queryset.query.annotations and ORDER_VAR not in self.params:
+            return ['-search_rank', '-pk']
+        return super().get_ordering(request, queryset)
+
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(LargeTableAdmin):
     list_display = ('firstname', 'lastname', 'email', 'mobile', 'role',
                     'company_name', 'date_created', 'sale_contact', 'id')
+    list_select_related = ('sale_contact',)
+    autocomplete_fields = ('sale_contact',)
+    readonly_fields = ('contract_count', 'signed_amount', 'next_event_date')
+    search_fields = ('email',)
+    search_help_text = 'Words starting the firstname, lastname, email or company name.'
     inlines = [ContractInline]
 
+    def get_changelist(self, request, **kwargs):
+        return RankedChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # The indexed search of the API instead of an icontains on each field.
+        try:
+            return search_clients(queryset, search_term).order_by('-search_rank', 'id'), False
+        except ValueError:
+            return queryset, False
+
 @admin.register(Event)
-class EventAdmin(admin.ModelAdmin):
+class EventAdmin(LargeTableAdmin):
     list_display = ('date_created', 'date_updated', 'attendees', 'event_date',
-                    'notes', 'client', 'support_contact')
+                    'short_notes', 'client', 'support_contact')
+    list_select_related = ('client', 'support_contact')
+    autocomplete_fields = ('client', 'contract', 'support_contact')
+
+    @admin.display(description='notes')
+    def short_notes(self, event):
+        return Truncator(event.notes).chars(80)
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import APIException
+
+from .authentication import ClaimsJWTAuthentication, user_cache
+from . import views
+
+
+# Threads running the ORM part of the async views, one database connection each.
+db_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_DB_THREADS', 8), thread_name_prefix='api-db')
+
+
+def run_in_db_thread(func, *args, **kwargs):
+    return sync_to_async(func, thread_sensitive=False, executor=db_executor)(*args, **kwargs)
+
+
+class PreAuthenticated(BaseAuthentication):
+    """The (user, token) authenticated by the async view before the sync view runs."""
+
+    def authenticate(self, request):
+        return getattr(request._request, 'async_auth', None)
+
+    def authenticate_header(self, request):
+        return ClaimsJWTAuthentication().authenticate_header(request)
+
+
+async def authenticate(request):
+    """
+    Authenticate the JWT of the request on the event loop, the token claims or
+    the user cache are enough in most cases; only a stale or claimless token
+    reads the user in a database thread. The user change mark is read with
+    the async cache API, which doesn't block the loop.
+    """
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    token = authentication.get_validated_token(raw_token)
+    changed_at = await user_cache.achanged_at(authentication.get_user_id(token))
+    user = authentication.get_user_without_query(token, changed_at)
+    if user is None:
+        user = await run_in_db_thread(authentication.load_user, token)
+    return authentication.check_active(user), token
+
+
+def error_response(exc, request):
+    detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+    response = JsonResponse(detail, status=exc.status_code)
+    if exc.status_code == 401:
+        response['WWW-Authenticate'] = ClaimsJWTAuthentication().authenticate_header(request)
+    return response
+
+
+def render_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view_class):
+    """
+    ASGI variant of a sync API view.
+
+    Django 4.0 has no async ORM and runs the sync views of an ASGI server one
+    at a time in a single thread. The async variant authenticates on the event
+    loop, then runs the view in the ASYNC_DB_THREADS pool: up to that many
+    slow queries run at once, the other requests wait on the event loop
+    without holding a thread. Exports stream from a sync iterator and are only
+    served by the sync views.
+    """
+    sync_view = view_class.as_view(authentication_classes=[PreAuthenticated])
+
+    async def view(request, *args, **kwargs):
+        if 'export' in request.GET:
+            return JsonResponse({'detail': ["Exports aren't served by the async endpoints, use the sync ones."]},
+                                status=404)
+        try:
+            request.async_auth = await authenticate(request)
+        except APIException as exc:
+            return error_response(exc, request)
+        return await run_in_db_thread(render_view, sync_view, request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    view.view_class = view_class
+    return view
+
+
+client_list = async_view(views.ClientList)
+client_detail = async_view(views.ClientDetail)
+contract_list = async_view(views.ContractList)
+contract_detail = async_view(views.ContractDetail)
+event_list = async_view(views.EventList)
+event_detail = async_view(views.EventDetail)
@@ -0,0 +1,147 @@
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    Small in-process LRU cache of authenticated users, entries expire after 'ttl' seconds.
+
+    'invalidate' is called when a user is saved or deleted: it drops the entry
+    and writes when it happened in the USER_CACHE_ALIAS cache, shared by the
+    server processes. The users cached by the other processes before that
+    time are dropped, and the tokens issued before it stop being trusted for
+    their claims. The mark expires with the claims it distrusts, after
+    'claims_max_age' seconds.
+    """
+    changed_format = 'api:user-changed:{user_id}'
+
+    def __init__(self, ttl, max_size, alias, claims_max_age):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.alias = alias
+        self.claims_max_age = claims_max_age
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def changed_at(self, user_id):
+        return self.cache.get(self.changed_format.format(user_id=user_id), 0)
+
+    async def achanged_at(self, user_id):
+        return await self.cache.aget(self.changed_format.format(user_id=user_id), 0)
+
+    def get(self, user_id, changed_at=0):
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None:
+                return None
+            expires, loaded_at, user = entry
+            if expires < time.monotonic() or loaded_at <= changed_at:
+                del self.users[user_id]
+                return None
+            self.users.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self.lock:
+            self.users[user_id] = (time.monotonic() + self.ttl, time.time(), user)
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+        self.cache.set(self.changed_format.format(user_id=user_id), time.time(), timeout=self.claims_max_age)
+
+    def trusts_claims(self, issued_at, changed_at):
+        """Claims issued after the last change of the user and less than 'claims_max_age' seconds ago."""
+        return issued_at is not None and changed_at < issued_at and time.time() - issued_at < self.claims_max_age
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+
+
+user_cache = UserCache(
+    ttl=getattr(settings, 'USER_CACHE_TTL', 60),
+    max_size=getattr(settings, 'USER_CACHE_SIZE', 1000),
+    alias=getattr(settings, 'USER_CACHE_ALIAS', 'default'),
+    claims_max_age=int(getattr(settings, 'USER_CLAIMS_MAX_AGE', api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())),
+)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that doesn't query the database.
+
+    The user is built from the 'username', 'role' and 'is_active' claims added
+    by TokenSerializer and TokenRefreshSerializer. Tokens without these claims,
+    issued before the user was last saved (in any process, see UserCache) or
+    more than USER_CLAIMS_MAX_AGE seconds ago fall back to a database lookup.
+    """
+
+    def get_user(self, validated_token):
+        user = self.get_user_without_query(validated_token)
+        if user is None:
+            user = self.load_user(validated_token)
+        return self.check_active(user)
+
+    def load_user(self, validated_token):
+        """Read the user from the database and cache it."""
+        user_id = self.get_user_id(validated_token)
+        try:
+            user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        user_cache.set(user_id, user)
+        return user
+
+    def get_user_without_query(self, validated_token, changed_at=None):
+        """
+        The cached user or the user built from the claims, None when the
+        database must be read. 'changed_at' is read from the user cache
+        when not given, see UserCache.achanged_at() for the async views.
+        """
+        user_id = self.get_user_id(validated_token)
+        if changed_at is None:
+            changed_at = user_cache.changed_at(user_id)
+        user = user_cache.get(user_id, changed_at)
+        if user is None and 'role' in validated_token \
+                and user_cache.trusts_claims(validated_token.get('iat'), changed_at):
+            user = self.user_from_claims(user_id, validated_token)
+            user_cache.set(user_id, user)
+        return user
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def check_active(self, user):
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
+
+    def user_from_claims(self, user_id, token):
+        user = self.user_model(
+            username=token.get('username', ''),
+            role=token['role'],
+            is_active=token.get('is_active', True),
+        )
+        setattr(user, api_settings.USER_ID_FIELD, user_id)
+        user._state.adding = False
+        user._state.db = 'default'
+        return user
@@ -0,0 +1,77 @@
+import time
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ResponseCache:
+    """
+    Cache of list responses keyed by user, role, host, path and normalized
+    query parameters.
+
+    Each key also holds the version of the models the list renders. Saving or
+    deleting one of them bumps its version (see api/signals.py), which makes
+    every cached list depending on it unreachable; these entries are then
+    evicted by the backend TTL / LRU (LocMemCache in tests, Redis in prod).
+    """
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def version_key(self, model_name):
+        return f'api:version:{model_name}'
+
+    def versions(self, model_names):
+        keys = [self.version_key(name) for name in model_names]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # A version evicted by the backend restarts from a new value, not from 0.
+                self.cache.add(key, time.time_ns(), timeout=None)
+                versions[key] = self.cache.get(key)
+        return '.'.join(str(versions[key]) for key in keys)
+
+    def key(self, request, model_names):
+        params = sorted((name, value) for name in request.query_params for value in request.query_params.getlist(name))
+        query = hashlib.sha1(repr(params).encode()).hexdigest()
+        return (f'api:list:{request.user.id}:{request.user.role}:{request.get_host()}{request.path}:'
+                f'{query}:{self.versions(model_names)}')
+
+    def get(self, key):
+        value = self.cache.get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout=timeout or self.timeout)
+
+    def invalidate(self, *model_names):
+        for name in model_names:
+            try:
+                self.cache.incr(self.version_key(name))
+            except ValueError:
+                self.cache.add(self.version_key(name), time.time_ns(), timeout=None)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+response_cache = ResponseCache(
+    alias=getattr(settings, 'LIST_CACHE_ALIAS', 'default'),
+    timeout=getattr(settings, 'LIST_CACHE_TIMEOUT', 30),
+)
@@ -0,0 +1,115 @@
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+
+FEED_SALT = 'api.calendar.feed'
+
+# Days of past and future events in the iCal feeds.
+FEED_WINDOW_DAYS = (30, 365)
+
+
+def feed_token(user):
+    """
+    Secret of the iCal feed URL of 'user', calendar applications can't send a
+    JWT. It holds the user's feed_version: a new version revokes it.
+    """
+    return signing.dumps([user.pk, user.feed_version], salt=FEED_SALT)
+
+
+def feed_key(token):
+    """
+    The (user id, feed_version) of a token, raise signing.BadSignature when
+    it wasn't made by feed_token().
+    """
+    key = signing.loads(token, salt=FEED_SALT)
+    if not isinstance(key, list) or len(key) != 2 or not all(type(value) is int for value in key):
+        raise signing.BadSignature('Invalid feed token.')
+    return key
+
+
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n'))
+
+
+def fold(line):
+    """Split a content line in lines of 75 octets at most (RFC 5545 3.1)."""
+    data = line.encode('utf-8')
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Don't cut a UTF-8 character in two.
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(parts)
+
+
+def utc_stamp(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def vevent(event):
+    """The VEVENT of an event read with its client, a whole day event."""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event.id}@epicevents',
+        f'DTSTAMP:{utc_stamp(event.date_updated)}',
+        f'LAST-MODIFIED:{utc_stamp(event.date_updated)}',
+        f"DTSTART;VALUE=DATE:{event.event_date.strftime('%Y%m%d')}",
+        f"DTEND;VALUE=DATE:{(event.event_date + datetime.timedelta(days=1)).strftime('%Y%m%d')}",
+        f'SUMMARY:{escape(f"{event.client.company_name or event.client} ({event.attendees} attendees)")}',
+        f'DESCRIPTION:{escape(event.notes)}',
+        f'CONTACT:{escape(event.client.email)}',
+        'END:VEVENT',
+    ]
+    return ''.join(fold(line) + '\r\n' for line in lines)
+
+
+def calendar(name, vevents):
+    header = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Epic Events//API//EN', 'CALSCALE:GREGORIAN',
+              f'X-WR-CALNAME:{escape(name)}']
+    return ''.join(fold(line) + '\r\n' for line in header) + ''.join(vevents) + 'END:VCALENDAR\r\n'
+
+
+class VEventCache:
+    """
+    VEVENT text of the events, keyed by the event and client versions
+    (their date_updated): a feed only renders the events changed since it
+    was last read, a change gives a new key and the old entry expires.
+    """
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, event_id, event_updated, client_updated):
+        return f'api:vevent:{event_id}:{event_updated.timestamp()}:{client_updated.timestamp()}'
+
+    def vevents(self, versions, load):
+        """
+        'versions' are (event id, event date_updated, client date_updated)
+        rows, 'load' reads the events of the given ids with their client.
+        """
+        keys = [self.key(*version) for version in versions]
+        cached = self.cache.get_many(keys)
+        missing = {version[0]: key for version, key in zip(versions, keys) if key not in cached}
+        if missing:
+            rendered = {missing[event.id]: vevent(event) for event in load(list(missing))}
+            self.cache.set_many(rendered, timeout=self.timeout)
+            cached.update(rendered)
+        return [cached[key] for key in keys if key in cached]
+
+
+vevent_cache = VEventCache(
+    alias=getattr(settings, 'CALENDAR_CACHE_ALIAS', 'default'),
+    timeout=getattr(settings, 'CALENDAR_CACHE_TIMEOUT', 7 * 24 * 3600),
+)
@@ -0,0 +1,226 @@
+import re
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .search import search_clients
+
+
+def parse_date(value):
+    try:
+        year, month, day = map(int, re.split(r'\-|\/|\.', value))
+        return datetime.date(year, month, day)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a valid date, use YYYY-MM-DD.")
+
+
+def parse_month(value):
+    try:
+        year, month = map(int, re.split(r'\-|\/|\.', value))
+        return datetime.date(year, month, 1)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a valid month, use YYYY-MM.")
+
+
+def parse_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a valid number.")
+
+
+class Filter:
+    """
+    Compile 'name', 'name__<lookup>' query parameters into a Q on 'field_name'.
+    'in' and 'between' take comma separated values.
+    """
+    lookups = ('exact', 'in')
+
+    def __init__(self, field_name, lookups=None):
+        self.field_name = field_name
+        if lookups is not None:
+            self.lookups = lookups
+
+    def parse(self, value):
+        return value
+
+    def compile(self, lookup, raw):
+        if lookup not in self.lookups:
+            raise ValueError(f"Lookup '{lookup}' isn't allowed on '{self.field_name}'.")
+        if lookup in ('in', 'between'):
+            values = [self.parse(value) for value in raw.split(',') if value]
+            if not values or (lookup == 'between' and len(values) != 2):
+                raise ValueError(f"'{lookup}' needs {'2' if lookup == 'between' else 'some'} comma separated values.")
+            if lookup == 'between':
+                return self.between(*values)
+            return self.in_(values)
+        return self.lookup(lookup, self.parse(raw))
+
+    def lookup(self, lookup, value):
+        return Q(**{f'{self.field_name}__{lookup}': value})
+
+    def in_(self, values):
+        return Q(**{f'{self.field_name}__in': values})
+
+    def between(self, low, high):
+        return Q(**{f'{self.field_name}__gte': low, f'{self.field_name}__lte': high})
+
+
+class CharFilter(Filter):
+    pass
+
+
+class NumberFilter(Filter):
+    lookups = ('exact', 'in', 'gt', 'gte', 'lt', 'lte', 'between')
+
+    def parse(self, value):
+        return parse_number(value)
+
+
+class DateFilter(Filter):
+    lookups = ('exact', 'in', 'gt', 'gte', 'lt', 'lte', 'between')
+
+    def parse(self, value):
+        return parse_date(value)
+
+
+class DateTimeFilter(DateFilter):
+    """
+    Dates on a datetime column, compiled to half-open ranges
+    [day 00:00, next day 00:00) instead of __year/__month/__day extracts,
+    so the database can use an index range scan.
+    """
+
+    def start_of(self, day):
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+    def range(self, first_day, last_day):
+        return Q(**{
+            f'{self.field_name}__gte': self.start_of(first_day),
+            f'{self.field_name}__lt': self.start_of(last_day + datetime.timedelta(days=1)),
+        })
+
+    def lookup(self, lookup, day):
+        if lookup == 'exact':
+            return self.range(day, day)
+        next_day = day + datetime.timedelta(days=1)
+        bounds = {
+            'gt': ('gte', next_day),
+            'gte': ('gte', day),
+            'lt': ('lt', day),
+            'lte': ('lt', next_day),
+        }
+        lookup, day = bounds[lookup]
+        return Q(**{f'{self.field_name}__{lookup}': self.start_of(day)})
+
+    def in_(self, days):
+        query = Q()
+        for day in days:
+            query |= self.range(day, day)
+        return query
+
+    def between(self, first_day, last_day):
+        return self.range(first_day, last_day)
+
+
+class FilterSet:
+    """
+    Validated filters and ordering of a list endpoint.
+
+    'filters' maps a query parameter to a Filter, 'ordering_fields' are the
+    columns the 'ordering' parameter accepts (with an optional '-'), 'id' is
+    always added as the last ordering column for the keyset pagination.
+    A FilterSet with a 'search' method handles the 'search' parameter, its
+    results are ordered by their 'search_rank' unless an ordering is given.
+    A list only holds the rows visible to the user (see VisibilityQuerySet),
+    as the detail views only find those. 'responsible' is still accepted as
+    0 or 1, which both kept the user's rows.
+    Ordering by one of the 'nullable_ordering_fields' leaves out the rows
+    where it is NULL, a cursor can't hold a NULL.
+    """
+    filters = {}
+    ordering_fields = ('date_created',)
+    nullable_ordering_fields = ()
+    default_ordering = 'date_created'
+    ordering_param = 'ordering'
+    search_param = 'search'
+    responsible_param = 'responsible'
+
+    def __init__(self, query_params):
+        self.query_params = query_params
+
+    def filter_queryset(self, queryset, user):
+        self.check_responsible()
+        queryset = queryset.visible_to(user)
+        query = Q()
+        for param in self.query_params:
+            name, _, lookup = param.partition('__')
+            if name not in self.filters:
+                continue
+            query &= self.filters[name].compile(lookup or 'exact', self.query_params[param])
+        ordering = self.query_params.get(self.ordering_param, '').lstrip('-')
+        if ordering in self.nullable_ordering_fields:
+            query &= Q(**{f'{ordering}__isnull': False})
+        queryset = queryset.filter(query)
+        if self.searching:
+            queryset = self.search(queryset, self.query_params[self.search_param])
+        return queryset
+
+    def check_responsible(self):
+        if self.query_params.get(self.responsible_param) not in (None, '0', '1'):
+            raise ValueError(f"'{self.responsible_param}' must be 0 or 1.")
+
+    @property
+    def searching(self):
+        return hasattr(self, 'search') and self.search_param in self.query_params
+
+    @property
+    def ordering(self):
+        ordering_fields = self.ordering_fields + (('search_rank',) if self.searching else ())
+        default_ordering = '-search_rank' if self.searching else self.default_ordering
+        ordering = self.query_params.get(self.ordering_param, default_ordering)
+        if ordering.lstrip('-') not in ordering_fields:
+            raise ValueError(f"Can't order by '{ordering}', choose in {', '.join(ordering_fields)}.")
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+
+class ClientFilter(FilterSet):
+    filters = {
+        'lastname': CharFilter('lastname'),
+        'email': CharFilter('email'),
+        'role': CharFilter('role'),
+        'company_name': CharFilter('company_name'),
+        'date_created': DateTimeFilter('date_created'),
+        'contract_count': NumberFilter('contract_count'),
+        'signed_amount': NumberFilter('signed_amount'),
+        'next_event_date': DateFilter('next_event_date'),
+    }
+    ordering_fields = ('date_created', 'lastname', 'contract_count', 'signed_amount', 'next_event_date')
+    nullable_ordering_fields = ('next_event_date',)
+
+    def search(self, queryset, text):
+        return search_clients(queryset, text)
+
+
+class ContractFilter(FilterSet):
+    filters = {
+        'lastname': CharFilter('client__lastname'),
+        'email': CharFilter('client__email'),
+        'status': CharFilter('status'),
+        'amount': NumberFilter('amount'),
+        'payment_due': DateFilter('payment_due'),
+        'date_created': DateTimeFilter('date_created'),
+    }
+    ordering_fields = ('date_created', 'amount')
+
+
+class EventFilter(FilterSet):
+    filters = {
+        'lastname': CharFilter('client__lastname'),
+        'email': CharFilter('client__email'),
+        'attendees': NumberFilter('attendees'),
+        'event_date': DateFilter('event_date'),
+        'date_created': DateTimeFilter('date_created'),
+    }
+    ordering_fields = ('date_created', 'event_date')
@@ -0,0 +1,298 @@
+import json
+import time
+import random
+import datetime
+import itertools
+import statistics
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client as TestClient, override_settings
+from django.urls import URLPattern
+from django.utils import timezone
+
+from api.calendar import feed_token
+from api.models import User, Client, Contract, Event
+from api.serializers import TokenSerializer
+from api.sync import Watermark
+from api.urls import urlpatterns
+
+
+class LiveClient:
+    """Send the requests to a running server instead of the in-process test client."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, data=None, content_type=None, authorization=None):
+        headers = {'Authorization': authorization} if authorization else {}
+        if content_type:
+            headers['Content-Type'] = content_type
+        body = data.encode('utf-8') if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers.get('X-Query-Count'), len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('X-Query-Count'), len(e.read())
+
+
+class InProcessClient:
+
+    def request(self, method, path, data=None, content_type=None, authorization=None):
+        extra = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        if data is not None:
+            extra['content_type'] = content_type
+        response = TestClient(raise_request_exception=False).generic(method, path, data or '', **extra)
+        size = len(response.content) if not response.streaming else sum(len(part) for part in response)
+        return response.status_code, response.get('X-Query-Count'), size
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted 'values'."""
+    if not values:
+        return None
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Drive every route of api/urls.py with JWT authenticated users and report the "
+            "p50/p95/p99 latency, throughput and SQL queries per request of each one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests sent to each route.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--warmup', type=int, default=5, help='Requests sent to each route before measuring.')
+        parser.add_argument('--routes', help="Comma separated routes to run, e.g. 'clients/,events/<int:pk>'.")
+        parser.add_argument('--writes', action='store_true',
+                            help='Also run the routes that create rows (POST on lists and imports).')
+        parser.add_argument('--cache', action='store_true',
+                            help='Let the list cache answer, by default every request misses it.')
+        parser.add_argument('--throttle', action='store_true',
+                            help='Keep the throttle rates, by default the in-process requests are never throttled.')
+        parser.add_argument('--password', default='password', help='Password of the seeded users, for signin/.')
+        parser.add_argument('--base-url', help='Benchmark a running server, e.g. http://localhost:8000.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['throttle'] or options['base_url']:
+            return self.benchmark(options)
+        # A few users send every request, the rates of a --base-url server are its own.
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+            return self.benchmark(options)
+
+    def benchmark(self, options):
+        self.random = random.Random(options['random_seed'])
+        self.options = options
+        self.request_ids = itertools.count()
+        self.client = LiveClient(options['base_url']) if options['base_url'] else InProcessClient()
+        self.prefix = '/api/v1/'
+        self.load_fixtures()
+
+        scenarios = self.scenarios()
+        routes = [str(pattern.pattern) for pattern in urlpatterns
+                  if isinstance(pattern, URLPattern) and 'format' not in pattern.pattern.converters
+                  and '(?P<format>' not in str(pattern.pattern)]
+        missing = [route for route in routes if route not in {scenario['route'] for scenario in scenarios}]
+        if missing:
+            raise CommandError(f"No scenario for the routes: {', '.join(missing)}.")
+        if options['routes']:
+            selected = options['routes'].split(',')
+            scenarios = [scenario for scenario in scenarios if scenario['route'] in selected]
+        if not options['writes']:
+            skipped = [scenario for scenario in scenarios if scenario['writes']]
+            scenarios = [scenario for scenario in scenarios if not scenario['writes']]
+            for scenario in skipped:
+                self.stdout.write(f"skipped {scenario['method']} {scenario['route']} (use --writes)")
+        if 'metrics' not in self.users:
+            scenarios = [scenario for scenario in scenarios if scenario['role'] != 'metrics']
+            self.stdout.write("skipped GET metrics/ (set METRICS_TOKEN)")
+
+        results = []
+        self.stdout.write(f"{'route':<28}{'method':<7}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}"
+                          f"{'queries':>9}{'bytes':>9}{'errors':>8}")
+        for scenario in scenarios:
+            result = self.run(scenario)
+            results.append(result)
+            self.stdout.write(
+                f"{result['route']:<28}{result['method']:<7}{result['throughput']:>8.1f}"
+                f"{result['p50_ms']:>8.1f}{result['p95_ms']:>8.1f}{result['p99_ms']:>8.1f}"
+                f"{result['queries_per_request'] if result['queries_per_request'] is not None else '-':>9}"
+                f"{result['bytes_per_request']:>9}{result['errors']:>8}")
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(self.report(results), output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+
+    def report(self, results):
+        return {
+            'date': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'base_url': self.options['base_url'],
+            'options': {name: self.options[name] for name in ('requests', 'concurrency', 'warmup', 'writes', 'cache', 'throttle')},
+            'rows': {model._meta.model_name: model.objects.count() for model in (User, Client, Contract, Event)},
+            'results': results,
+        }
+
+    def load_fixtures(self):
+        self.users = {}
+        for role in ('seller', 'support', 'manager'):
+            # The user with the most rows, to benchmark the worst case of a skewed dataset.
+            related = {'seller': 'clients', 'support': 'events'}.get(role)
+            user = self.busiest_user(role, related)
+            if user is None:
+                raise CommandError(f"No active '{role}' user, run seed_data first.")
+            token = TokenSerializer.get_token(user)
+            self.users[role] = {'user': user, 'access': f'Bearer {token.access_token}', 'refresh': str(token)}
+        if settings.METRICS_TOKEN:
+            self.users['metrics'] = {'access': f'Bearer {settings.METRICS_TOKEN}'}
+
+        seller, support = self.users['seller']['user'], self.users['support']['user']
+        self.ids = {
+            'client': list(Client.objects.filter(sale_contact=seller).values_list('id', flat=True)[:1000]),
+            'client_email': list(Client.objects.filter(sale_contact=seller, role='client')
+                                 .values_list('email', flat=True)[:1000]),
+            'contract': list(Contract.objects.filter(sales_contact=seller).values_list('id', flat=True)[:1000]),
+            'event': list(Event.objects.filter(support_contact=support).values_list('id', flat=True)[:1000]),
+            'free_contract': list(Contract.objects.filter(sales_contact=seller, status='signed', events__isnull=True,
+                                                          client__sale_contact=seller)
+                                  .values_list('id', 'client__email')[:10000]),
+        }
+        for name in ('client', 'client_email', 'contract', 'event'):
+            if not self.ids[name]:
+                raise CommandError(f"No {name.replace('_', ' ')} for the benchmark users, run seed_data first.")
+
+    def busiest_user(self, role, related):
+        users = User.objects.filter(role=role, is_active=True)
+        if related:
+            users = users.annotate(rows=Count(related)).order_by('-rows', 'id')
+        return users.first()
+
+    def scenarios(self):
+        def scenario(route, method, role, path, body=None, content_type='application/json', writes=False):
+            return {'route': route, 'method': method, 'role': role, 'path': path, 'body': body,
+                    'content_type': content_type, 'writes': writes}
+
+        reads = []
+        for prefix in ('', 'async/'):
+            reads += [
+                scenario(f'{prefix}clients/', 'GET', 'seller', lambda p=prefix: self.list_path(f'{p}clients/')),
+                scenario(f'{prefix}clients/<int:pk>', 'GET', 'seller',
+                         lambda p=prefix: f"{p}clients/{self.pick('client')}"),
+                scenario(f'{prefix}contracts/', 'GET', 'seller', lambda p=prefix: self.list_path(f'{p}contracts/')),
+                scenario(f'{prefix}contracts/<int:pk>', 'GET', 'seller',
+                         lambda p=prefix: f"{p}contracts/{self.pick('contract')}"),
+                scenario(f'{prefix}events/', 'GET', 'seller', lambda p=prefix: self.list_path(f'{p}events/')),
+                scenario(f'{prefix}events/<int:pk>', 'GET', 'support',
+                         lambda p=prefix: f"{p}events/{self.pick('event')}"),
+            ]
+
+        reads += [scenario(f'{name}/sync/', 'GET', 'seller', lambda n=name: self.sync_path(f'{n}/sync/'))
+                  for name in ('clients', 'contracts', 'events')]
+
+        return reads + [
+            scenario('events/calendar/', 'GET', 'support', lambda: 'events/calendar/'),
+            scenario('events/calendar.ics', 'GET', None,
+                     lambda: f"events/calendar.ics?token={feed_token(self.users['support']['user'])}"),
+            scenario('reports/sales/', 'GET', 'manager', lambda: 'reports/sales/?group_by=seller,status,month'),
+            scenario('metrics/', 'GET', 'metrics', lambda: 'metrics/'),
+            scenario('signin/', 'POST', None, lambda: 'signin/', lambda: json.dumps(
+                {'username': self.users['seller']['user'].username, 'password': self.options['password']})),
+            scenario('token/refresh/', 'POST', None, lambda: 'token/refresh/',
+                     lambda: json.dumps({'refresh': self.users['seller']['refresh']})),
+            scenario('clients/', 'POST', 'seller', lambda: 'clients/', lambda: json.dumps(self.new_client()),
+                     writes=True),
+            scenario('contracts/', 'POST', 'seller', lambda: 'contracts/', lambda: json.dumps(self.new_contract()),
+                     writes=True),
+            scenario('events/', 'POST', 'seller', lambda: 'events/', lambda: json.dumps(self.new_event('client_mail')),
+                     writes=True),
+            scenario('contracts/batch/', 'POST', 'seller', lambda: 'contracts/batch/', lambda: json.dumps(
+                {'contracts': [{'id': id, 'status': 'signed'}
+                               for id in self.random.sample(self.ids['contract'], min(10, len(self.ids['contract'])))]}),
+                     writes=True),
+            scenario('clients/import/', 'POST', 'seller', lambda: 'clients/import/',
+                     lambda: self.ndjson(self.new_client), 'application/x-ndjson', writes=True),
+            scenario('contracts/import/', 'POST', 'seller', lambda: 'contracts/import/',
+                     lambda: self.ndjson(self.new_contract), 'application/x-ndjson', writes=True),
+            scenario('events/import/', 'POST', 'seller', lambda: 'events/import/',
+                     lambda: self.ndjson(lambda: self.new_event('client_email')), 'application/x-ndjson', writes=True),
+            # After 'events/calendar.ics', whose token it revokes.
+            scenario('events/calendar/feed/', 'POST', 'support', lambda: 'events/calendar/feed/', writes=True),
+        ]
+
+    def list_path(self, path):
+        if self.options['cache']:
+            return path
+        # A distinct ignored parameter, so every request misses the list cache.
+        return f'{path}?benchmark={next(self.request_ids)}'
+
+    def sync_path(self, path):
+        # The poll of an integration that last synced an hour ago.
+        since = timezone.now() - datetime.timedelta(hours=1)
+        return f'{path}?updated_since={Watermark((since, 0), (since, 0)).encode()}'
+
+    def pick(self, name):
+        return self.random.choice(self.ids[name])
+
+    def ndjson(self, row, size=10):
+        return ''.join(json.dumps(row()) + '\n' for _ in range(size))
+
+    def new_client(self):
+        n = next(self.request_ids)
+        stamp = f'{time.time_ns() % 10 ** 8:08d}{n % 100:02d}'
+        return {'firstname': 'Bench', 'lastname': f'Mark{n}', 'email': f'bench{stamp}@example.com',
+                'mobile': stamp, 'company_name': 'Benchmark'}
+
+    def new_contract(self):
+        return {'client_email': self.pick('client_email'), 'amount': round(self.random.uniform(500, 50000), 2),
+                'payment_due': (datetime.date.today() + datetime.timedelta(days=30)).isoformat()}
+
+    def new_event(self, email_field):
+        if not self.ids['free_contract']:
+            raise CommandError("No signed contract without event left for the event routes.")
+        contract_id, email = self.ids['free_contract'].pop()
+        return {email_field: email, 'contract_id': contract_id, 'attendees': 50,
+                'event_date': (datetime.date.today() + datetime.timedelta(days=60)).isoformat(),
+                'notes': 'Benchmark event.'}
+
+    def send(self, scenario):
+        authorization = self.users[scenario['role']]['access'] if scenario['role'] else None
+        body = scenario['body']() if scenario['body'] else None
+        start = time.perf_counter()
+        status, queries, size = self.client.request(
+            scenario['method'], self.prefix + scenario['path'](), body, scenario['content_type'], authorization)
+        return time.perf_counter() - start, status, queries, size
+
+    def run(self, scenario):
+        for _ in range(self.options['warmup']):
+            self.send(scenario)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.options['concurrency']) as executor:
+            samples = list(executor.map(lambda _: self.send(scenario), range(self.options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        queries = [int(sample[2]) for sample in samples if sample[2] is not None]
+        return {
+            'route': scenario['route'],
+            'method': scenario['method'],
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[1] >= 400),
+            'statuses': dict(sorted({str(status): sum(1 for sample in samples if sample[1] == status)
+                                     for status in {sample[1] for sample in samples}}.items())),
+            'throughput': round(len(samples) / elapsed, 2),
+            'mean_ms': round(statistics.mean(latencies), 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+            'bytes_per_request': round(statistics.mean(sample[3] for sample in samples)),
+        }
@@ -0,0 +1,95 @@
+import time
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+
+from api.models import User
+from api.serializers import TokenSerializer
+
+
+class Command(BaseCommand):
+    help = ("Compare the throughput of a list endpoint served by the sync views under WSGI, "
+            "the sync views under ASGI and the async views under ASGI.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='clients/', help="Endpoint under /api/v1/, e.g. 'events/?page_size=20'.")
+        parser.add_argument('--username', help='User sending the requests, the first seller by default.')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once.')
+        parser.add_argument('--wsgi-threads', type=int, default=8, help='Worker threads of the WSGI server.')
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help='Seconds added to each SQL query to simulate a slow database.')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username=options['username']) if options['username'] else \
+            User.objects.filter(role='seller').order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to send the requests, run seed_data first.")
+        self.authorization = f'Bearer {TokenSerializer.get_token(user).access_token}'
+        self.latency = options['latency']
+        self.request_ids = itertools.count()
+        self.add_latency(connection)
+        connection_created.connect(self.on_connection_created)
+
+        sync_url, async_url = f"/api/v1/{options['path']}", f"/api/v1/async/{options['path']}"
+        n, concurrency = options['requests'], options['concurrency']
+        # One user sends every request, it would be throttled.
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+            results = [
+                ('WSGI sync views', self.run_wsgi(sync_url, n, min(concurrency, options['wsgi_threads']))),
+                ('ASGI sync views', self.run_asgi(sync_url, n, concurrency)),
+                ('ASGI async views', self.run_asgi(async_url, n, concurrency)),
+            ]
+        connection_created.disconnect(self.on_connection_created)
+
+        self.stdout.write(f"{n} requests to {options['path']}, {concurrency} concurrent, "
+                          f"{self.latency * 1000:.0f}ms added per query")
+        for name, (elapsed, statuses) in results:
+            errors = sum(1 for status in statuses if status >= 400)
+            self.stdout.write(f"{name:<18} {n / elapsed:8.1f} req/s  {elapsed:6.2f}s  {errors} errors")
+
+    def on_connection_created(self, sender, connection, **kwargs):
+        self.add_latency(connection)
+
+    def add_latency(self, connection):
+        # Inserted first: the connection can be created inside an execute_wrapper() block, which pops the last one.
+        if self.latency and self.slow_query not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, self.slow_query)
+
+    def slow_query(self, execute, sql, params, many, context):
+        time.sleep(self.latency)
+        return execute(sql, params, many, context)
+
+    def urls(self, url, n):
+        # A distinct ignored parameter per request of the whole run, so the list cache is never hit.
+        separator = '&' if '?' in url else '?'
+        return [f'{url}{separator}benchmark={next(self.request_ids)}' for _ in range(n)]
+
+    def run_wsgi(self, url, n, threads):
+        def get(url):
+            return Client().get(url, HTTP_AUTHORIZATION=self.authorization).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            statuses = list(executor.map(get, self.urls(url, n)))
+        return time.perf_counter() - start, statuses
+
+    def run_asgi(self, url, n, concurrency):
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def get(url):
+                async with semaphore:
+                    return (await AsyncClient().get(url, authorization=self.authorization)).status_code
+            return await asyncio.gather(*(get(url) for url in self.urls(url, n)))
+
+        start = time.perf_counter()
+        statuses = asyncio.run(run())
+        return time.perf_counter() - start, statuses
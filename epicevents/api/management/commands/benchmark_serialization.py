@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api import rendering
+from api.rendering import RowSerializer, render_json
+from api.views import ClientList, ContractList, EventList
+
+
+LISTS = {'clients': ClientList, 'contracts': ContractList, 'events': EventList}
+
+
+class Command(BaseCommand):
+    help = ("Compare the serializers and the values_list() fast path (FAST_LIST_RENDERING) on the rows "
+            "of the list endpoints, and check that both render the same bytes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lists', default=','.join(LISTS), help='Comma separated, in: ' + ', '.join(LISTS))
+        parser.add_argument('--rows', type=int, default=500, help='Rows rendered at once (MAX_PAGE_SIZE by default).')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each path, the fastest is kept.')
+
+    def handle(self, *args, **options):
+        names = options['lists'].split(',')
+        unknown = [name for name in names if name not in LISTS]
+        if unknown:
+            raise CommandError(f"Unknown lists: {', '.join(unknown)}.")
+
+        self.stdout.write(f"JSON encoder of the fast path: {'orjson' if rendering.orjson else 'json (orjson not installed)'}")
+        self.stdout.write(f"{'list':<11}{'rows':>6}{'path':>12}{'sql ms':>9}{'build ms':>10}{'render ms':>11}"
+                          f"{'total ms':>10}{'speedup':>9}")
+        for name in names:
+            self.compare(name, LISTS[name], options['rows'], options['repeat'])
+
+    def compare(self, name, view_class, rows, repeat):
+        view = view_class()
+        ordering = ('date_created', 'id')
+        queryset = view_class.queryset.all()
+        serializer = view.serializer_class()
+
+        def serializer_path():
+            instances = list(view.prune_queryset(queryset, ordering).order_by(*ordering)[:rows])
+            yield
+            data = {'next': None, 'results': view.serializer_class(instances, many=True).data}
+            yield
+            yield JSONRenderer().render(data)
+
+        columns = ['pk', *view.get_columns(queryset, ordering)]
+        row_serializer = RowSerializer(serializer, columns)
+
+        def fast_path():
+            values = list(queryset.values_list(*columns, named=True).order_by(*ordering)[:rows])
+            yield
+            results = row_serializer.data(values)
+            data = {'next': None, 'results': results}
+            yield
+            yield render_json(data, results, row_serializer.float_names)
+
+        slow, slow_content = self.best(serializer_path, repeat)
+        fast, fast_content = self.best(fast_path, repeat)
+        if slow_content != fast_content:
+            raise CommandError(f"{name}: the fast path doesn't render the bytes of the serializers.")
+
+        count = slow_content.count(b'"id":')
+        for path, timings in (('serializer', slow), ('fast', fast)):
+            speedup = f'{sum(slow) / sum(timings):8.1f}x' if path == 'fast' else ''
+            self.stdout.write(f"{name:<11}{count:>6}{path:>12}{timings[0] * 1000:9.1f}{timings[1] * 1000:10.1f}"
+                              f"{timings[2] * 1000:11.1f}{sum(timings) * 1000:10.1f}{speedup}")
+
+    def best(self, path, repeat):
+        """Fastest (sql, build, render) durations of 'path', a generator pausing after each step."""
+        runs = []
+        for _ in range(repeat):
+            steps = path()
+            start = time.perf_counter()
+            next(steps)
+            fetched = time.perf_counter()
+            next(steps)
+            built = time.perf_counter()
+            content = next(steps)
+            rendered = time.perf_counter()
+            runs.append((fetched - start, built - fetched, rendered - built))
+        return min(runs, key=sum), content
@@ -0,0 +1,97 @@
+import re
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from api.models import User, Client, Contract, Event
+from api.views import ClientList, ContractList, EventList
+
+
+# A list query is accepted when no table of its plan is read with a full scan.
+FULL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'SCAN (\w+)(?! USING)(?:\s|$)'),
+}
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the queries of the list endpoints filters and check that each one uses an index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Number of clients to generate with seed_data before the check.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            call_command('seed_data', clients=options['seed'], stdout=self.stdout)
+        if not Contract.objects.exists() or not Event.objects.exists():
+            raise CommandError("The database is empty, run it with --seed.")
+        self.analyze()
+
+        full_scan = FULL_SCAN.get(connection.vendor)
+        if full_scan is None:
+            raise CommandError(f"No plan parser for the '{connection.vendor}' database.")
+
+        failures = 0
+        for view, query, user in self.cases():
+            plan = self.explain(view, query, user)
+            tables = [table for table in full_scan.findall(plan) if table.startswith('api_')]
+            if tables:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FULL SCAN {view.__name__} ?{query} ({user.role}) on {', '.join(tables)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"INDEX     {view.__name__} ?{query} ({user.role})"))
+            if options['verbosity'] > 1 or tables:
+                self.stdout.write(plan)
+        if failures:
+            raise CommandError(f"{failures} list queries don't use an index.")
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def cases(self):
+        client = Client.objects.filter(contracts__isnull=False).first()
+        contract = Contract.objects.filter(sales_contact__isnull=False).first()
+        event = Event.objects.filter(support_contact__isnull=False).first()
+        seller, support = contract.sales_contact, event.support_contact
+        manager = User(role='manager')
+        day = contract.date_created.date().isoformat()
+
+        return [
+            (ClientList, '', manager),
+            (ClientList, f'lastname={client.lastname}', manager),
+            (ClientList, 'ordering=lastname', manager),
+            (ClientList, f'email={client.email}', manager),
+            (ClientList, f'date_created={day}', manager),
+            (ClientList, 'role=prospect', manager),
+            (ClientList, '', seller),
+            (ClientList, '', support),
+            (ContractList, '', manager),
+            (ContractList, '', seller),
+            (ContractList, '', support),
+            (ContractList, f'date_created={day}', manager),
+            (ContractList, f'amount={contract.amount}', manager),
+            (ContractList, 'amount__gte=40000&ordering=-amount', manager),
+            (ContractList, 'status=signed', manager),
+            (ContractList, f'lastname={client.lastname}', manager),
+            (ContractList, f'email={client.email}', manager),
+            (EventList, '', manager),
+            (EventList, '', support),
+            (EventList, '', seller),
+            (EventList, f'event_date={event.event_date.isoformat()}', manager),
+            (EventList, 'ordering=event_date', manager),
+            (EventList, f'email={client.email}', manager),
+        ]
+
+    def queryset(self, view, query, user):
+        params = QueryDict(query)
+        filters = view.filter_class(params)
+        queryset = filters.filter_queryset(view.queryset.all(), user)
+        return queryset.order_by(*filters.ordering)[:settings.PAGE_SIZE + 1]
+
+    def explain(self, view, query, user):
+        return self.queryset(view, query, user).explain()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.sync import SYNC_TOMBSTONE_DAYS, purge_tombstones
+
+
+class Command(BaseCommand):
+    help = ("Delete the tombstones of the sync endpoints older than SYNC_TOMBSTONE_DAYS days "
+            "(run it daily), a sync client with an older watermark syncs again from scratch.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=SYNC_TOMBSTONE_DAYS)
+
+    def handle(self, *args, **options):
+        tombstones = purge_tombstones(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {tombstones} tombstones."))
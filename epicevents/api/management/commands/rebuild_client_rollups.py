@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import rebuild_client_rollups, refresh_past_next_events
+
+
+class Command(BaseCommand):
+    help = ("Recompute the contract count, signed amount and next event date of every client, "
+            "or with --past-events only of the clients whose next event is over (run it daily).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--past-events', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['past_events']:
+            clients = refresh_past_next_events(batch_size=options['batch_size'])
+        else:
+            clients = rebuild_client_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the rollups of {clients} clients."))
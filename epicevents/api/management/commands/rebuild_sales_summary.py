@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.models import User
+from api.reports import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SalesSummary table from the contracts, for every seller or the given ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sellers', nargs='*', help='Usernames of the sellers to rebuild, all by default.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sales_contact_ids = None
+        if options['sellers']:
+            sales_contact_ids = list(User.objects.filter(username__in=options['sellers']).values_list('id', flat=True))
+        rows = rebuild_summary(sales_contact_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} sales summary rows."))
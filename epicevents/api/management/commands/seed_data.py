@@ -0,0 +1,136 @@
+import random
+import datetime
+import itertools
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api.models import User, Client, Contract, Event
+from api.reports import count_contracts
+from api.rollups import refresh_client_rollups
+
+
+@contextmanager
+def keep_dates(*models):
+    """Let bulk_create keep the generated 'date_created' instead of now()."""
+    fields = [model._meta.get_field('date_created') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "Generate fake sellers, supports, clients, contracts and events with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10000)
+        parser.add_argument('--sellers', type=int, default=20)
+        parser.add_argument('--supports', type=int, default=20)
+        parser.add_argument('--managers', type=int, default=1)
+        parser.add_argument('--seller-skew', type=float, default=0,
+                            help='Zipf exponent of the clients per seller, 0 spreads them evenly, 1 or more '
+                                 'gives most of them to a few sellers.')
+        parser.add_argument('--support-skew', type=float, default=0, help='Zipf exponent of the events per support.')
+        parser.add_argument('--contracts', type=int, default=3, help='Average number of contracts per client.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--random-seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['random_seed'])
+        self.now = timezone.now()
+        sellers = self.create_users('seller', options['sellers'], options['password'])
+        supports = self.create_users('support', options['supports'], options['password'])
+        self.create_users('manager', options['managers'], options['password'])
+        self.pick_seller = self.picker(sellers, options['seller_skew'])
+        self.pick_support = self.picker(supports, options['support_skew'])
+
+        start = (Client.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        created = {'clients': 0, 'contracts': 0, 'events': 0}
+        with keep_dates(Client, Contract, Event):
+            for offset in range(0, options['clients'], options['batch_size']):
+                size = min(options['batch_size'], options['clients'] - offset)
+                with transaction.atomic():
+                    clients = self.create_clients(start + offset, size)
+                    contracts = self.create_contracts(clients, options['contracts'])
+                    count_contracts(contracts)
+                    events = self.create_events(contracts)
+                    refresh_client_rollups(client.id for client in clients)
+                created['clients'] += len(clients)
+                created['contracts'] += len(contracts)
+                created['events'] += len(events)
+                self.stdout.write(f"{created['clients']}/{options['clients']} clients", ending='\r')
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['clients']} clients, {created['contracts']} contracts "
+            f"and {created['events']} events."))
+
+    def random_date(self, days_before, days_after=0):
+        return self.now + datetime.timedelta(seconds=self.random.randint(-days_before * 86400, days_after * 86400))
+
+    def picker(self, users, skew):
+        """Random choice among 'users', the n-th one being picked with a weight of 1 / n ** skew."""
+        if not users:
+            return lambda: None
+        weights = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, len(users) + 1)))
+        return lambda: self.random.choices(users, cum_weights=weights)[0]
+
+    def create_users(self, role, number, password):
+        start = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        password = make_password(password)
+        users = [User(username=f'{role}{start + i}', role=role, password=password) for i in range(number)]
+        return User.objects.bulk_create(users)
+
+    def create_clients(self, start, size):
+        clients = []
+        for n in range(start, start + size):
+            clients.append(Client(
+                firstname=f'Firstname{n % 5000}',
+                lastname=f'Lastname{n % 20000}',
+                email=f'client{n}@example.com',
+                mobile=f'{n:010d}',
+                role='prospect' if self.random.random() < 0.2 else 'client',
+                company_name=f'Company {n % 50000}',
+                date_created=self.random_date(3 * 365),
+                sale_contact=self.pick_seller(),
+            ))
+        return Client.objects.bulk_create(clients)
+
+    def create_contracts(self, clients, average):
+        contracts = []
+        for client in clients:
+            if client.role == 'prospect':
+                continue
+            for _ in range(self.random.randint(0, 2 * average)):
+                contracts.append(Contract(
+                    client=client,
+                    sales_contact=client.sale_contact,
+                    status=self.random.choices(['signed', 'unsigned', 'ended'], [5, 3, 2])[0],
+                    amount=round(self.random.uniform(500, 50000), 2),
+                    payment_due=self.random_date(365, 365).date(),
+                    date_created=max(client.date_created, self.random_date(3 * 365)),
+                ))
+        return Contract.objects.bulk_create(contracts)
+
+    def create_events(self, contracts):
+        events = []
+        for contract in contracts:
+            if contract.status == 'unsigned' or self.random.random() < 0.3:
+                continue
+            events.append(Event(
+                client_id=contract.client_id,
+                contract=contract,
+                support_contact=self.pick_support(),
+                attendees=self.random.randint(5, 500),
+                event_date=self.random_date(365, 365).date(),
+                notes='Generated event.',
+                date_created=contract.date_created,
+            ))
+        return Event.objects.bulk_create(events)
@@ -0,0 +1,193 @@
+import time
+import bisect
+import threading
+from contextvars import ContextVar
+
+from .cache import response_cache
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Metric:
+    """A metric family, one value per set of label values."""
+    type = None
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+
+    def format_labels(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = list(self.values.items())
+        return self.header() + [f'{self.name}{self.format_labels(labels)} {value}' for labels, value in values]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(labels, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self.values[labels] = (counts, total + value)
+
+    def render(self):
+        with self.lock:
+            values = [(labels, (list(counts), total)) for labels, (counts, total) in self.values.items()]
+        lines = self.header()
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{self.format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f'{self.name}_sum{self.format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{self.format_labels(labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """
+    Metrics of this process, rendered in the Prometheus text format.
+
+    Each server process keeps its own values: with several workers, scrape
+    each of them (Prometheus adds the instance label).
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=()):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, function):
+        """'function' returns (name, type, help, value) tuples of values read when scraped."""
+        self.collectors.append(function)
+        return function
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for collect in self.collectors:
+            for name, type, help, value in collect():
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} {type}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+LABELS = ('route', 'view', 'method')
+
+requests_total = registry.counter(
+    'api_requests_total', 'Requests handled, by route and status.', LABELS + ('status',))
+request_duration = registry.histogram(
+    'api_request_duration_seconds', 'Time to build the response.', LABELS,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+db_queries = registry.histogram(
+    'api_db_queries', 'SQL queries run by a request.', LABELS, buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+db_duration = registry.counter(
+    'api_db_duration_seconds_total', 'Time spent running SQL queries.', LABELS)
+response_size = registry.histogram(
+    'api_response_size_bytes', 'Size of the response body, streamed responses excepted.', LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576))
+
+
+@registry.collector
+def list_cache_stats():
+    stats = response_cache.stats()
+    return [
+        ('api_list_cache_hits_total', 'counter', 'List responses served from the cache.', stats['hits']),
+        ('api_list_cache_misses_total', 'counter', 'List responses built by the view.', stats['misses']),
+    ]
+
+
+class QueryStats:
+    """SQL queries count and time of one request, its queries can run in several threads."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, duration):
+        with self.lock:
+            self.count += 1
+            self.duration += duration
+
+
+# Stats of the request being handled, contextvars follow the request into
+# the threads of sync_to_async (sync views under ASGI, async views).
+current_query_stats = ContextVar('current_query_stats', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = current_query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(time.perf_counter() - start)
+
+
+def install(connection):
+    """
+    Add count_query to a new database connection. It goes first: the
+    connection can be opened inside a connection.execute_wrapper() block,
+    which removes the last wrapper when it exits.
+    """
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+def view_name(match):
+    view = getattr(match.func, 'view_class', match.func)
+    return f'{view.__module__}.{view.__qualname__}'
+
+
+def observe(request, response, stats, duration):
+    match = request.resolver_match
+    labels = (match.route, view_name(match), request.method) if match else ('unmatched', '', request.method)
+    requests_total.inc(labels + (str(response.status_code),))
+    request_duration.observe(labels, duration)
+    db_queries.observe(labels, stats.count)
+    db_duration.inc(labels, stats.duration)
+    if not response.streaming:
+        response_size.observe(labels, len(response.content))
@@ -0,0 +1,100 @@
+import time
+import asyncio
+
+from .metrics import QueryStats, current_query_stats, observe
+from .routers import Routing, current_routing, primary_pins, replica_aliases
+
+
+class MetricsMiddleware:
+    """
+    Record the count, latency, SQL queries, SQL time and response size of
+    each request by route, exposed in the Prometheus format by 'metrics/'.
+    A streamed response is recorded once sent, its queries run meanwhile.
+    Async capable, so it doesn't move the async views to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Mark the instance as a coroutine function, as django.utils.deprecation.MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats, start = QueryStats(), time.perf_counter()
+        token = current_query_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        return self.record(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats, start = QueryStats(), time.perf_counter()
+        token = current_query_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_stats.reset(token)
+        return self.record(request, response, stats, start)
+
+    def record(self, request, response, stats, start):
+        if response.streaming:
+            response.streaming_content = self.observe_when_sent(
+                response.streaming_content, request, response, stats, start)
+        else:
+            observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def observe_when_sent(self, content, request, response, stats, start):
+        try:
+            yield from content
+        finally:
+            observe(request, response, stats, time.perf_counter() - start)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the reads of safe requests to a replica (see api.routers.ReplicaRouter),
+    unless the client wrote less than REPLICA_PIN_SECONDS ago: a request which
+    wrote pins its client to the primary. Does nothing without DATABASE_REPLICAS.
+    """
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+        routing = Routing(primary=request.method not in self.safe_methods or primary_pins.pinned(request))
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if routing.wrote:
+            primary_pins.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+        routing = Routing(primary=request.method not in self.safe_methods or await primary_pins.apinned(request))
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if routing.wrote:
+            await primary_pins.apin(request, response)
+        return response
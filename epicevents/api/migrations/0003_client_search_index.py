@@ -0,0 +1,64 @@
+# Generated by Django 4.0 on 2026-10-18 00:22
+
+from django.db import migrations
+
+
+# Must stay identical to the document searched in api/search.py so PostgreSQL uses the indexes.
+DOCUMENT = "(firstname || ' ' || lastname || ' ' || email || ' ' || company_name)"
+
+POSTGRESQL = [
+    ("CREATE EXTENSION IF NOT EXISTS pg_trgm",
+     None),
+    (f"CREATE INDEX client_search_tsv_idx ON api_client USING gin (to_tsvector('simple', {DOCUMENT}))",
+     "DROP INDEX IF EXISTS client_search_tsv_idx"),
+    (f"CREATE INDEX client_search_trgm_idx ON api_client USING gin ({DOCUMENT} gin_trgm_ops)",
+     "DROP INDEX IF EXISTS client_search_trgm_idx"),
+]
+
+SQLITE = [
+    ("CREATE VIRTUAL TABLE api_client_fts USING fts5("
+     "firstname, lastname, email, company_name, content='api_client', content_rowid='id', prefix='2 3')",
+     "DROP TABLE IF EXISTS api_client_fts"),
+    ("CREATE TRIGGER api_client_fts_insert AFTER INSERT ON api_client BEGIN "
+     "INSERT INTO api_client_fts(rowid, firstname, lastname, email, company_name) "
+     "VALUES (new.id, new.firstname, new.lastname, new.email, new.company_name); END",
+     "DROP TRIGGER IF EXISTS api_client_fts_insert"),
+    ("CREATE TRIGGER api_client_fts_delete AFTER DELETE ON api_client BEGIN "
+     "INSERT INTO api_client_fts(api_client_fts, rowid, firstname, lastname, email, company_name) "
+     "VALUES ('delete', old.id, old.firstname, old.lastname, old.email, old.company_name); END",
+     "DROP TRIGGER IF EXISTS api_client_fts_delete"),
+    ("CREATE TRIGGER api_client_fts_update AFTER UPDATE ON api_client BEGIN "
+     "INSERT INTO api_client_fts(api_client_fts, rowid, firstname, lastname, email, company_name) "
+     "VALUES ('delete', old.id, old.firstname, old.lastname, old.email, old.company_name); "
+     "INSERT INTO api_client_fts(rowid, firstname, lastname, email, company_name) "
+     "VALUES (new.id, new.firstname, new.lastname, new.email, new.company_name); END",
+     "DROP TRIGGER IF EXISTS api_client_fts_update"),
+    ("INSERT INTO api_client_fts(api_client_fts) VALUES ('rebuild')",
+     None),
+]
+
+
+def statements(schema_editor):
+    return {'postgresql': POSTGRESQL, 'sqlite': SQLITE}.get(schema_editor.connection.vendor, [])
+
+
+def create_search_index(apps, schema_editor):
+    for sql, _ in statements(schema_editor):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    for _, sql in reversed(statements(schema_editor)):
+        if sql:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
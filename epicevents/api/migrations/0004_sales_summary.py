@@ -0,0 +1,54 @@
+# Generated by Django 4.0 on 2026-10-18 00:23
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def backfill_summary(apps, schema_editor):
+    # As api.reports.rebuild_summary(), on the models of this migration.
+    Contract = apps.get_model('api', 'Contract')
+    SalesSummary = apps.get_model('api', 'SalesSummary')
+    rows = Contract.objects.annotate(month=TruncMonth('payment_due')) \
+        .values('sales_contact_id', 'status', 'month') \
+        .annotate(contracts=Count('id'), amount=Sum('amount')).order_by()
+    SalesSummary.objects.bulk_create((SalesSummary(**row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_client_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('signed', 'Signed'), ('unsigned', 'Unsigned'), ('ended', 'Ended')], max_length=8)),
+                ('month', models.DateField(null=True)),
+                ('contracts', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('sales_contact', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_summaries', to='api.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salessummary',
+            constraint=models.UniqueConstraint(fields=('sales_contact', 'status', 'month'), name='sales_summary_unique_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='salessummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('sales_contact__isnull', True)), fields=('status', 'month'), name='sales_summary_unique_no_seller'),
+        ),
+        migrations.AddConstraint(
+            model_name='salessummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('month__isnull', True)), fields=('sales_contact', 'status'), name='sales_summary_unique_no_month'),
+        ),
+        migrations.AddConstraint(
+            model_name='salessummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('month__isnull', True), ('sales_contact__isnull', True)), fields=('status',), name='sales_summary_unique_no_seller_month'),
+        ),
+        migrations.RunPython(backfill_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0 on 2026-10-18 00:35
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_events(apps, schema_editor):
+    """
+    Precondition: at most one event per contract. The events created twice
+    on a contract are business data, the migration doesn't choose which to
+    delete; it stops with the contracts to fix, e.g. in the admin.
+    """
+    Event = apps.get_model('api', 'Event')
+    duplicates = list(Event.objects.values('contract').annotate(events=Count('id'))
+                      .filter(events__gt=1).order_by('contract').values_list('contract', flat=True)[:100])
+    if duplicates:
+        raise RuntimeError(
+            f"These contracts have several events, keep one event per contract before migrating: "
+            f"{', '.join(map(str, duplicates))}.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_sales_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_events, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='event',
+            constraint=models.UniqueConstraint(fields=('contract',), name='event_unique_contract'),
+        ),
+    ]
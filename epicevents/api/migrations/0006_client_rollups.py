@@ -0,0 +1,93 @@
+# Generated by Django 4.0 on 2026-10-18 00:42
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, IntegerField, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+
+search_index = import_module('api.migrations.0003_client_search_index')
+
+# On SQLite, AddField rebuilds api_client, which drops the triggers keeping
+# api_client_fts up to date (0003): they are created again and the index rebuilt.
+FTS_TRIGGERS = [(sql, reverse) for sql, reverse in search_index.SQLITE if sql.startswith('CREATE TRIGGER')]
+FTS_REBUILD = "INSERT INTO api_client_fts(api_client_fts) VALUES ('rebuild')"
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql, drop in FTS_TRIGGERS:
+        schema_editor.execute(drop)
+        schema_editor.execute(sql)
+    schema_editor.execute(FTS_REBUILD)
+
+
+def rollup_of(queryset, aggregate, output_field):
+    rows = queryset.filter(client=OuterRef('pk')).order_by().values('client').annotate(value=aggregate)
+    return Subquery(rows.values('value'), output_field=output_field)
+
+
+def backfill_rollups(apps, schema_editor):
+    # As api.rollups.refresh_client_rollups(), on the models of this migration.
+    Client = apps.get_model('api', 'Client')
+    Contract = apps.get_model('api', 'Contract')
+    Event = apps.get_model('api', 'Event')
+    today = timezone.localdate()
+    rollups = {
+        'contract_count': Coalesce(rollup_of(Contract.objects.all(), Count('id'), IntegerField()), Value(0)),
+        'signed_amount': Coalesce(
+            rollup_of(Contract.objects.filter(status='signed'), Sum('amount'), FloatField()), Value(0.0)),
+        'next_event_date': rollup_of(Event.objects.filter(event_date__gte=today), Min('event_date'), None),
+    }
+    last_id = 0
+    while True:
+        client_ids = list(Client.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:1000])
+        if not client_ids:
+            return
+        # date_updated moves: the ETags of the clients change with their new fields.
+        Client.objects.filter(id__in=client_ids).update(date_updated=Now(), **rollups)
+        last_id = client_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_event_unique_contract'),
+    ]
+
+    operations = [
+        # Reversed last, after RemoveField rebuilt api_client again.
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='client',
+            name='contract_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='next_event_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='signed_amount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['contract_count', 'id'], name='client_contract_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['signed_amount', 'id'], name='client_signed_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['next_event_date', 'id'], name='client_next_event_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,347 @@
+import re
+import csv
+import json
+import hashlib
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import response_cache
+from .metrics import current_query_stats
+from .rendering import RenderedResponse, RowSerializer, render_json
+from .routers import reading_replica
+
+
+logger = logging.getLogger(__name__)
+
+
+TRANSACTION_STATEMENT = re.compile(r'\s*(BEGIN|SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudgetMixin:
+    """
+    Count the SQL queries run while handling a request.
+
+    'query_budget' maps an HTTP method to the number of queries the view may
+    run once the request is authenticated. Transaction statements (BEGIN,
+    SAVEPOINT...) aren't counted, they depend on the database backend.
+    The total count is sent back in
+    the 'X-Query-Count' header, going over the budget is logged, and raises
+    QueryBudgetExceeded when the QUERY_BUDGET_ENFORCE setting is on (by
+    default only when running the tests).
+    """
+    query_budget = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        self.query_count = 0
+        self.budget = None
+        # Every database: the reads may go to a replica (see api.routers).
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.count_query))
+            response = super().dispatch(request, *args, **kwargs)
+        response['X-Query-Count'] = self.query_count
+        if self.budget is not None:
+            response['X-Query-Budget'] = self.budget
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.budget = self.query_budget.get(request.method)
+        self.budget_start = self.query_count
+
+    def count_query(self, execute, sql, params, many, context):
+        if TRANSACTION_STATEMENT.match(sql):
+            return execute(sql, params, many, context)
+        self.query_count += 1
+        if self.budget is not None and self.query_count - self.budget_start > self.budget:
+            message = (f"{self.__class__.__name__} {self.request.method} ran "
+                       f"{self.query_count - self.budget_start} "
+                       f"queries, budget is {self.budget}: {sql}")
+            if getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return execute(sql, params, many, context)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def counted(content, count_query=None):
+    """
+    Iterate over a streamed content, which runs its queries once the view
+    returned, with them counted in the metrics of the request and by
+    count_query (QueryBudgetMixin.count_query).
+    """
+    stats = current_query_stats.get()
+
+    def chunks():
+        iterator = iter(content)
+        try:
+            while True:
+                token = current_query_stats.set(stats)
+                try:
+                    with ExitStack() as stack:
+                        if count_query is not None:
+                            for connection in connections.all():
+                                stack.enter_context(connection.execute_wrapper(count_query))
+                        chunk = next(iterator, None)
+                finally:
+                    current_query_stats.reset(token)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+    return chunks()
+
+
+class StreamingExportMixin:
+    """
+    Stream a whole filtered list as NDJSON or CSV when '?export=' is given.
+
+    Rows are read with QuerySet.iterator() (a server-side cursor on
+    PostgreSQL) and serialized one by one while the response is sent, so the
+    memory used doesn't depend on the size of the table. The database is
+    chosen when the view runs (the routing of the request is gone once it
+    returned) and the queries run while sending are still counted.
+    """
+    export_param = 'export'
+    export_formats = ('ndjson', 'csv')
+    export_chunk_size = 2000
+
+    def get_export_format(self, request):
+        export_format = request.query_params.get(self.export_param)
+        if export_format is not None and export_format not in self.export_formats:
+            raise ValueError(f"Can't export to '{export_format}', choose in {', '.join(self.export_formats)}.")
+        return export_format
+
+    def export(self, queryset, export_format):
+        queryset = queryset.using(queryset.db)
+        serializer = self.get_serializer()
+        rows = (serializer.to_representation(instance)
+                for instance in queryset.iterator(chunk_size=self.export_chunk_size))
+        if export_format == 'csv':
+            content, content_type = self.csv_lines(serializer, rows), 'text/csv'
+        else:
+            content, content_type = self.ndjson_lines(rows), 'application/x-ndjson'
+
+        response = StreamingHttpResponse(
+            counted(content, getattr(self, 'count_query', None)), content_type=content_type)
+        name = queryset.model._meta.verbose_name_plural.replace(' ', '_')
+        response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+        return response
+
+    def ndjson_lines(self, rows):
+        for row in rows:
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    def csv_lines(self, serializer, rows):
+        fields = list(serializer.fields)
+        writer = csv.DictWriter(Echo(), fieldnames=fields)
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+
+
+def column_value(instance, column):
+    """'client__email' of a values_list() row or of a model instance read with its relations."""
+    if not hasattr(instance, '_meta'):
+        return getattr(instance, column)
+    value = instance
+    for name in column.split('__'):
+        value = getattr(value, name) if value is not None else None
+    return value
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators built from the 'date_updated' of the rows a
+    response renders, a request whose validators match gets a 304 without
+    running the serializer. The ETag also holds the related values the rows
+    render (the serializer Meta.sparse_columns through a relation, e.g.
+    'client__email'), which change without moving 'date_updated'.
+    """
+
+    def get_related_columns(self):
+        serializer_class = self.get_serializer_class()
+        sparse_columns = getattr(serializer_class.Meta, 'sparse_columns', {})
+        fields = getattr(self, 'sparse_fields', None) or list(sparse_columns)
+        return [column for name in fields for column in sparse_columns.get(name, ()) if '__' in column]
+
+    def get_validators(self, instances, key=''):
+        related_columns = self.get_related_columns()
+        relations = {column.rsplit('__', 1)[0] for column in related_columns}
+        digest = hashlib.sha1(key.encode())
+        versions = []
+        for instance in instances:
+            related = [column_value(instance, column) for column in related_columns]
+            digest.update(f'{instance.pk}:{instance.date_updated.timestamp()}:{related!r};'.encode())
+            versions += self.versions(instance, relations)
+        last_modified = max(versions, default=None)
+        return quote_etag(digest.hexdigest()), last_modified and int(last_modified.timestamp())
+
+    def versions(self, instance, relations):
+        """
+        'date_updated' of the row and of the related rows read with it which
+        have one. The users have none, a change of a rendered username only
+        moves the ETag, which If-None-Match checks before If-Modified-Since.
+        """
+        yield instance.date_updated
+        if hasattr(instance, '_meta'):
+            for relation in relations:
+                related = column_value(instance, relation)
+                date_updated = vars(related).get('date_updated') if related is not None else None
+                if date_updated is not None:
+                    yield date_updated
+
+    def conditional_get(self, request, instances, render, key='', use_last_modified=True):
+        """'render' builds the response when the client copy is stale."""
+        etag, last_modified = self.get_validators(instances, key)
+        if not use_last_modified:
+            last_modified = None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render()
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def conditional_page(self, request, page, render=None):
+        """
+        A page is identified by the request path and whether it has a next
+        page. It has no Last-Modified, which can't tell that a row was deleted.
+        """
+        render = render or (lambda: self.get_paginated_response(self.get_serializer(page, many=True).data))
+        return self.conditional_get(
+            request, page, render, key=f'{request.get_full_path()}:{self.paginator.has_next}', use_last_modified=False)
+
+
+class CachedListMixin:
+    """
+    Serve list pages from the response cache, 'cache_dependencies' are the
+    models rendered by the list: a change on one of them invalidates it.
+    Exports are never cached. A page read from a replica may miss the last
+    writes, it is only kept REPLICA_PIN_SECONDS.
+    """
+    cache_dependencies = ()
+
+    def cached_list(self, request, *args, **kwargs):
+        if request.query_params.get(getattr(self, 'export_param', 'export')):
+            return self.list(request, *args, **kwargs)
+
+        key = response_cache.key(request, self.cache_dependencies)
+        cached = response_cache.get(key)
+        if cached is not None:
+            data, etag = cached
+            response = get_conditional_response(request, etag=etag) or Response(data)
+            response['ETag'] = etag
+            response['X-Cache'] = 'HIT'
+            patch_vary_headers(response, ['Authorization'])
+            return response
+
+        response = self.list(request, *args, **kwargs)
+        if response.status_code == 200 and isinstance(response, Response):
+            timeout = getattr(settings, 'REPLICA_PIN_SECONDS', 5) if reading_replica() else None
+            response_cache.set(key, (response.data, response['ETag']), timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class SparseFieldsMixin:
+    """
+    '?fields=id,event_date' narrows a list to these fields: the serializer
+    only renders them and the query only reads their columns, joining only
+    the relations they use. Without the parameter every field of the
+    serializer is rendered, still without reading the other columns.
+
+    A serializer field that isn't a column of the model lists the columns it
+    reads in the serializer Meta.sparse_columns, e.g. 'client__email'. The
+    primary key, 'date_updated' (ETag) and the ordering columns (cursor) are
+    always read.
+    """
+    fields_param = 'fields'
+    sparse_fields = None
+
+    def get_sparse_fields(self, request):
+        value = request.query_params.get(self.fields_param)
+        if value is None:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        available = list(self.serializer_class().fields)
+        unknown = [name for name in fields if name not in available]
+        if not fields or unknown:
+            raise ValueError(f"Can't select the fields '{value}', choose in {', '.join(available)}.")
+        return fields
+
+    def get_columns(self, queryset, ordering=()):
+        """Columns read by the rendered fields, the ETag and the cursor, annotations included."""
+        fields = self.sparse_fields or list(self.serializer_class().fields)
+        sparse_columns = getattr(self.serializer_class.Meta, 'sparse_columns', {})
+        columns = [queryset.model._meta.pk.name, 'date_updated']
+        columns += [name.lstrip('-') for name in ordering]
+        for name in fields:
+            columns += sparse_columns.get(name, (name,))
+        return list(dict.fromkeys(columns))
+
+    def prune_queryset(self, queryset, ordering=()):
+        columns = [column for column in self.get_columns(queryset, ordering)
+                   if column not in queryset.query.annotations]
+
+        # A relation followed by select_related() can't be deferred, nor any relation on its path.
+        relations = set()
+        for column in columns:
+            path = column.split('__')[:-1]
+            relations.update('__'.join(path[:i]) for i in range(1, len(path) + 1))
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*columns, *relations)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.sparse_fields is not None:
+            kwargs.setdefault('fields', self.sparse_fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class FastListMixin:
+    """
+    Render list pages from values_list() rows when the FAST_LIST_RENDERING
+    setting is on: RowSerializer builds the representation of the serializer
+    and render_json the bytes of JSONRenderer, without a serializer per row.
+    Only JSON responses without an indent take this path, the browsable API
+    and exports still go through the serializer.
+
+    'manage.py benchmark_serialization' compares both paths.
+    """
+
+    def fast_list_enabled(self, request):
+        return getattr(settings, 'FAST_LIST_RENDERING', False) and request.accepted_media_type == JSONRenderer.media_type
+
+    def fast_page(self, request, queryset):
+        columns = ['pk', *self.get_columns(queryset, self.keyset_ordering)]
+        page = self.paginate_queryset(queryset.values_list(*columns, named=True))
+        rows = RowSerializer(self.get_serializer(), columns)
+
+        def render():
+            results = rows.data(page)
+            data = {'next': self.paginator.get_next_link(), 'results': results}
+            return RenderedResponse(data, render_json(data, results, rows.float_names))
+        return self.conditional_page(request, page, render)
@@ -1,5 +1,5 @@
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.auth.models import User, PermissionsMixin
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
@@ -38,6 +38,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     role = models.CharField(choices=ROLE_CHOICES, default='manager', max_length=7)
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
+    # Version of the iCal feed URL (see api/calendar.py), a new one revokes the previous URLs.
+    feed_version = models.PositiveIntegerField(default=0)
 
     objects = UserManager()
 
@@ -60,6 +62,59 @@ class User(AbstractBaseUser, PermissionsMixin):
         return True if self.role == 'manager' else False
 
 
+class VisibilityQuerySet(models.QuerySet):
+    """
+    Rows a user is responsible of, as one predicate of the query: a join
+    condition or an EXISTS subquery, so it composes with the other filters.
+    'visibility' returns None when the user sees every row.
+    """
+
+    def visibility(self, user):
+        """
+        Hook of the subclasses: the Q or boolean expression selecting the rows of 'user',
+        or None when the user sees every row.
+        """
+        raise NotImplementedError(f"{type(self).__name__} must implement visibility().")
+
+    def visible_to(self, user):
+        condition = self.visibility(user)
+        return self if condition is None else self.filter(condition)
+
+    def with_visibility(self, user):
+        """Annotate 'is_visible' on each row instead of filtering."""
+        condition = self.visibility(user)
+        if condition is None:
+            condition = models.Value(True)
+        return self.annotate(is_visible=models.ExpressionWrapper(condition, output_field=models.BooleanField()))
+
+
+class ClientQuerySet(VisibilityQuerySet):
+    def visibility(self, user):
+        if user.role == 'seller':
+            return models.Q(sale_contact=user.id)
+        if user.role == 'support':
+            return models.Exists(Event.objects.filter(client=models.OuterRef('pk'), support_contact=user.id))
+        return None
+
+
+class ContractQuerySet(VisibilityQuerySet):
+    def visibility(self, user):
+        if user.role == 'seller':
+            return models.Q(sales_contact=user.id)
+        if user.role == 'support':
+            return models.Exists(Event.objects.filter(contract=models.OuterRef('pk'), support_contact=user.id))
+        return None
+
+
+class EventQuerySet(VisibilityQuerySet):
+    def visibility(self, user):
+        if user.role == 'seller':
+            return models.Q(client__sale_contact=user.id)
+        if user.role == 'support':
+            return models.Q(support_contact=user.id)
+        return None
+
+
 class Client(models.Model):
     ROLE_CHOICES = (
         ('prospect', 'Prospect'),
@@ -75,6 +130,25 @@ class Client(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
     sale_contact = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name='clients', null=True, blank=True)
+    # Rollups of the contracts and events, kept up to date by api/rollups.py.
+    contract_count = models.IntegerField(default=0)
+    signed_amount = models.FloatField(default=0)
+    next_event_date = models.DateField(null=True, blank=True)
+
+    objects = ClientQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='client_created_idx'),
+            models.Index(fields=['date_updated', 'id'], name='client_updated_idx'),
+            models.Index(fields=['lastname', 'id'], name='client_lastname_idx'),
+            models.Index(fields=['sale_contact', 'date_created', 'id'], name='client_seller_created_idx'),
+            models.Index(fields=['date_created', 'id'], name='client_prospect_created_idx',
+                         condition=models.Q(role='prospect')),
+            models.Index(fields=['contract_count', 'id'], name='client_contract_count_idx'),
+            models.Index(fields=['signed_amount', 'id'], name='client_signed_amount_idx'),
+            models.Index(fields=['next_event_date', 'id'], name='client_next_event_idx'),
+        ]
 
     def __str__(self):
         return self.email
@@ -94,8 +168,48 @@ class Contract(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='contracts')
     sales_contact = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='contracts', null=True)
 
+    objects = ContractQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='contract_created_idx'),
+            models.Index(fields=['date_updated', 'id'], name='contract_updated_idx'),
+            models.Index(fields=['sales_contact', 'date_created', 'id'], name='contract_seller_created_idx'),
+            models.Index(fields=['amount', 'id'], name='contract_amount_idx'),
+            models.Index(fields=['date_created', 'id'], name='contract_signed_created_idx',
+                         condition=models.Q(status='signed')),
+            models.Index(fields=['payment_due'], name='contract_signed_due_idx',
+                         condition=models.Q(status='signed')),
+        ]
+
     def __str__(self):
-        return f"contract '{self.status}' of {self.client}"
+        return self.label(self.status, self.client)
+
+    @staticmethod
+    def label(status, client):
+        return f"contract '{status}' of {client}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_summary()
+        instance._loaded_client_id = instance.__dict__.get('client_id')
+        return instance
+
+    def remember_summary(self):
+        """Keep the values counted in SalesSummary, to move them when the contract changes."""
+        fields = ('sales_contact_id', 'status', 'payment_due', 'amount')
+        deferred = self.get_deferred_fields()
+        self._summary = None if any(field in deferred for field in fields) else \
+            tuple(getattr(self, field) for field in fields)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
 
 
 class Event(models.Model):
@@ -108,4 +222,68 @@ class Event(models.Model):
     contract = models.ForeignKey(Contract, on_delete=models.CASCADE, related_name='events')
     support_contact = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='events', null=True)
 
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='event_created_idx'),
+            models.Index(fields=['date_updated', 'id'], name='event_updated_idx'),
+            models.Index(fields=['event_date', 'id'], name='event_date_idx'),
+            models.Index(fields=['support_contact', 'event_date'], name='event_support_date_idx'),
+            models.Index(fields=['support_contact', 'date_created', 'id'], name='event_support_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['contract'], name='event_unique_contract'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_client_id = instance.__dict__.get('client_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
+
+
+
+
+class SalesSummary(models.Model):
+    """
+    Contracts count and amount by seller, status and payment_due month, kept
+    up to date from the Contract signals (see api/reports.py).
+    """
+    sales_contact = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='sales_summaries', null=True)
+    status = models.CharField(choices=Contract.STATUS_CHOICE, max_length=8)
+    month = models.DateField(null=True)
+    contracts = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sales_contact', 'status', 'month'], name='sales_summary_unique_key'),
+            # NULLs are distinct in a unique constraint, the keys without seller or month get their own.
+            models.UniqueConstraint(fields=['status', 'month'], name='sales_summary_unique_no_seller',
+                                    condition=models.Q(sales_contact__isnull=True)),
+            models.UniqueConstraint(fields=['sales_contact', 'status'], name='sales_summary_unique_no_month',
+                                    condition=models.Q(month__isnull=True)),
+            models.UniqueConstraint(fields=['status'], name='sales_summary_unique_no_seller_month',
+                                    condition=models.Q(sales_contact__isnull=True, month__isnull=True)),
+        ]
+
+
+class Tombstone(models.Model):
+    """A deleted client, contract or event, reported by the sync endpoints."""
+    model_name = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    date_deleted = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['model_name', 'date_deleted', 'id'], name='tombstone_deleted_idx'),
+        ]
@@ -0,0 +1,103 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on an ordered tuple of columns, (date_created, id) by default.
+
+    The cursor holds the values of the last row of the page, the next page is
+    read with a WHERE on those values instead of an OFFSET, and one extra row
+    is fetched to know if there is a next page, so no COUNT(*) is ever run.
+    The last ordering column must be unique (the primary key), an ordering
+    column that isn't a model field (an annotation) must be a number.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('date_created', 'id')
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.position_filter(cursor))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'PAGE_SIZE', 50)
+        max_page_size = getattr(settings, 'MAX_PAGE_SIZE', 500)
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, page_size))
+        except ValueError:
+            raise NotFound('page_size must be an integer.')
+        return max(1, min(page_size, max_page_size))
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def position_filter(self, values):
+        """
+        Rows strictly after the cursor, e.g. for (date_created, id):
+        date_created >= d AND (date_created > d OR (date_created = d AND id > i)).
+        The leading range condition lets the database do an index range scan.
+        """
+        names = [field.lstrip('-') for field in self.ordering]
+        lookups = ['lt' if field.startswith('-') else 'gt' for field in self.ordering]
+
+        after = Q()
+        for i, name in enumerate(names):
+            clause = Q(**{f'{name}__{lookups[i]}': values[i]})
+            for previous, value in zip(names[:i], values):
+                clause &= Q(**{previous: value})
+            after |= clause
+        return Q(**{f'{names[0]}__{lookups[0]}e': values[0]}) & after
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip('-')) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def encode_cursor(self, values):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        return urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [self.to_python(model, field.lstrip('-'), value) for field, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            return float(value)
@@ -0,0 +1,85 @@
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+
+class RowsParser(BaseParser):
+    """
+    Parse an upload into a generator of (line number, row) tuples, read line
+    by line from the request stream so a large file is never fully loaded.
+    A row that can't be parsed or decoded is None, the next rows are still read.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return self.rows(Lines(iter(stream.readline, b''), encoding))
+
+    def rows(self, lines):
+        raise NotImplementedError
+
+
+class Lines:
+    """
+    Decoded lines of an upload. A line that isn't in 'encoding' is decoded
+    with replacement characters and its number kept in 'undecodable'.
+    """
+
+    def __init__(self, raw_lines, encoding):
+        self.raw_lines = raw_lines
+        self.encoding = encoding
+        self.count = 0
+        self.undecodable = set()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.raw_lines)
+        self.count += 1
+        try:
+            return line.decode(self.encoding)
+        except UnicodeDecodeError:
+            self.undecodable.add(self.count)
+            return line.decode(self.encoding, errors='replace')
+
+    def clean(self, first, last):
+        """True when the lines 'first' to 'last' were all decoded."""
+        return not any(first <= number <= last for number in self.undecodable)
+
+
+class NDJSONParser(RowsParser):
+    media_type = 'application/x-ndjson'
+
+    def rows(self, lines):
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line) if lines.clean(lines.count, lines.count) else None
+            except ValueError:
+                row = None
+            yield lines.count, row if isinstance(row, dict) else None
+
+
+class CSVParser(RowsParser):
+    media_type = 'text/csv'
+
+    def rows(self, lines):
+        reader = csv.DictReader(lines)
+        last = 0
+        while True:
+            # A quoted field can span several lines, a row is the lines read since the last one.
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error:
+                row = None
+            first, last = last + 1, lines.count
+            if row is None or not lines.clean(first, last):
+                yield last, None
+            else:
+                yield last, {key: value for key, value in row.items() if key and value != ''}
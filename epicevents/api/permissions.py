@@ -11,15 +11,27 @@ class IsSupport(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return True if request.user.role == 'support' else False
 
+class IsManager(permissions.BasePermission):
+    message = "Access denied, you're not a 'manager' user."
+    def has_object_permission(self, request, view, obj):
+        return True if request.user.role == 'manager' else False
+
+class IsSellerOrManager(permissions.BasePermission):
+    message = "Access denied, you're not a 'seller' or 'manager' user."
+    def has_object_permission(self, request, view, obj):
+        return True if request.user.role in ('seller', 'manager') else False
+
 class IsSellerResponsibleOfClient(permissions.BasePermission):
+    """'obj' is read with Client.objects.with_visibility(request.user)."""
     message = "Access denied, you're not responsible of this client."
     def has_object_permission(self, request, view, obj):
-        return True if request.user == obj.sale_contact else False
+        return obj.is_visible
 
 class IsSellerResponsibleOfContract(permissions.BasePermission):
+    """'obj' is read with Contract.objects.with_visibility(request.user)."""
     message = "Access denied, you're not responsible of this contract."
     def has_object_permission(self, request, view, obj):
-        return True if request.user == obj.sales_contact else False
+        return obj.is_visible
 
 class IsSalesContact(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -0,0 +1,122 @@
+import math
+
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Fields whose representation is the column value itself.
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.ChoiceField, serializers.BooleanField)
+
+
+def identity(value):
+    return value
+
+
+def datetime_converter(field):
+    """
+    DateTimeField.to_representation of aware datetimes in ISO 8601, with the
+    field timezone read once instead of for each value.
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = getattr(field, 'timezone', field.default_timezone())
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if not timezone.is_aware(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def column_mapper(index, convert):
+    if convert is identity:
+        return lambda row: row[index]
+    return lambda row: None if row[index] is None else convert(row[index])
+
+
+def columns_mapper(indexes, convert):
+    # A related row is missing when its first column is null.
+    return lambda row: None if row[indexes[0]] is None else convert(*(row[index] for index in indexes))
+
+
+class RowSerializer:
+    """
+    Representation of the rows of values_list(*columns) built as the
+    serializer builds the one of model instances, without instantiating the
+    serializer fields for each row.
+
+    A field reads the columns listed in the serializer Meta.sparse_columns
+    (its name by default), formatted by Meta.sparse_formats when there are
+    several, str() otherwise for a related field.
+    """
+
+    def __init__(self, serializer, columns):
+        meta = serializer.Meta
+        sparse_columns = getattr(meta, 'sparse_columns', {})
+        sparse_formats = getattr(meta, 'sparse_formats', {})
+        self.names = []
+        self.mappers = []
+        self.float_names = []
+        for field in serializer._readable_fields:
+            names = sparse_columns.get(field.field_name, (field.field_name,))
+            indexes = [columns.index(name) for name in names]
+            if len(indexes) > 1:
+                mapper = columns_mapper(indexes, sparse_formats[field.field_name])
+            elif isinstance(field, serializers.RelatedField):
+                mapper = column_mapper(indexes[0], str)
+            elif isinstance(field, IDENTITY_FIELDS):
+                mapper = column_mapper(indexes[0], identity)
+            elif isinstance(field, serializers.DateTimeField):
+                mapper = column_mapper(indexes[0], datetime_converter(field))
+            else:
+                mapper = column_mapper(indexes[0], field.to_representation)
+            if isinstance(field, serializers.FloatField):
+                self.float_names.append(field.field_name)
+            self.names.append(field.field_name)
+            self.mappers.append(mapper)
+
+    def data(self, rows):
+        items = list(zip(self.names, self.mappers))
+        return [{name: mapper(row) for name, mapper in items} for row in rows]
+
+
+def orjson_float(value):
+    """Whether orjson writes the float as json does: it never uses an exponent."""
+    return value is None or value == 0 or (1e-4 <= abs(value) < 1e16 and math.isfinite(value))
+
+
+def render_json(data, results=(), float_names=()):
+    """
+    The bytes JSONRenderer renders for 'data', written by orjson when it is
+    installed, the JSON settings of REST_FRAMEWORK are the default ones and
+    every float of 'results' (the rows, fields 'float_names') is written the
+    same way by both.
+    """
+    default_settings = api_settings.UNICODE_JSON and api_settings.COMPACT_JSON and api_settings.STRICT_JSON
+    if orjson is None or not default_settings or not all(
+            orjson_float(row[name]) for row in results for name in float_names):
+        return JSONRenderer().render(data)
+    return orjson.dumps(data).replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class RenderedResponse(Response):
+    """A JSON response whose content is already rendered, 'data' is kept for the list cache."""
+
+    def __init__(self, data, content, **kwargs):
+        super().__init__(data, content_type=JSONRenderer.media_type, **kwargs)
+        self.content_bytes = content
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = self.content_type
+        return self.content_bytes
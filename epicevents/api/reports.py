@@ -0,0 +1,117 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Contract, SalesSummary
+
+
+def month_of(day):
+    return day.replace(day=1) if day else None
+
+
+def summary_key(sales_contact_id, status, payment_due):
+    return (sales_contact_id, status, month_of(payment_due))
+
+
+def summary_of(contract):
+    return (contract.sales_contact_id, contract.status, contract.payment_due, contract.amount)
+
+
+def apply_deltas(deltas):
+    """Add {(sales_contact_id, status, month): [contracts, amount]} to the summary rows."""
+    for (sales_contact_id, status, month), (contracts, amount) in deltas.items():
+        if not contracts and not amount:
+            continue
+        key = {'sales_contact_id': sales_contact_id, 'status': status, 'month': month}
+        changes = {'contracts': F('contracts') + contracts, 'amount': F('amount') + amount}
+        if SalesSummary.objects.filter(**key).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                SalesSummary.objects.create(**key, contracts=contracts, amount=amount)
+        except IntegrityError:
+            # Created by a concurrent transaction since the update.
+            SalesSummary.objects.filter(**key).update(**changes)
+
+
+def count_contracts(contracts, sign=1):
+    """Add (sign=1) or remove (sign=-1) contracts saved without signals, e.g. by bulk_create."""
+    deltas = defaultdict(lambda: [0, 0.0])
+    for contract in contracts:
+        sales_contact_id, status, payment_due, amount = summary_of(contract)
+        delta = deltas[summary_key(sales_contact_id, status, payment_due)]
+        delta[0] += sign
+        delta[1] += sign * amount
+    apply_deltas(deltas)
+
+
+def move_contract(old, new):
+    """
+    Move a contract counted with the 'old' summary_of() values to the 'new'
+    ones, 'old' is None for a creation and 'new' is None for a deletion.
+    """
+    move_contracts([(old, new)])
+
+
+def move_contracts(moves):
+    """move_contract() for many (old, new) pairs, with one update per summary row."""
+    deltas = defaultdict(lambda: [0, 0.0])
+    for old, new in moves:
+        if old is not None:
+            delta = deltas[summary_key(*old[:3])]
+            delta[0] -= 1
+            delta[1] -= old[3]
+        if new is not None:
+            delta = deltas[summary_key(*new[:3])]
+            delta[0] += 1
+            delta[1] += new[3]
+    apply_deltas(deltas)
+
+
+def aggregate_contracts(contracts):
+    return contracts.annotate(month=TruncMonth('payment_due')) \
+        .values('sales_contact_id', 'status', 'month') \
+        .annotate(contracts=Count('id'), amount=Sum('amount')) \
+        .order_by()
+
+
+def rebuild_summary(sales_contact_ids=None, batch_size=1000):
+    """
+    Recompute the summary from the contracts, for every seller or only for
+    'sales_contact_ids' (None in it stands for contracts without seller).
+    """
+    summaries, contracts = SalesSummary.objects.all(), Contract.objects.all()
+    if sales_contact_ids is not None:
+        ids = [id for id in sales_contact_ids if id is not None]
+        if None in sales_contact_ids:
+            summaries = summaries.filter(sales_contact_id__in=ids) | summaries.filter(sales_contact__isnull=True)
+            contracts = contracts.filter(sales_contact_id__in=ids) | contracts.filter(sales_contact__isnull=True)
+        else:
+            summaries = summaries.filter(sales_contact_id__in=ids)
+            contracts = contracts.filter(sales_contact_id__in=ids)
+
+    with transaction.atomic():
+        summaries.delete()
+        rows = [SalesSummary(**row) for row in aggregate_contracts(contracts)]
+        SalesSummary.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def sales_report(group_by, summaries=None):
+    """Contracts count and amount from the summary table, grouped by 'seller', 'status' and/or 'month'."""
+    columns = {'seller': 'sales_contact__username', 'status': 'status', 'month': 'month'}
+    fields = [columns[name] for name in group_by]
+    summaries = SalesSummary.objects.all() if summaries is None else summaries
+    rows = summaries.values(*fields).annotate(contracts=Sum('contracts'), amount=Sum('amount')) \
+        .filter(contracts__gt=0).order_by(*fields)
+
+    report = []
+    for row in rows:
+        line = {name: row[columns[name]] for name in group_by}
+        if line.get('month'):
+            line['month'] = line['month'].strftime('%Y-%m')
+        line.update(contracts=row['contracts'], amount=round(row['amount'], 2))
+        report.append(line)
+    return report
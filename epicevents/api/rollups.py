@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models import Count, FloatField, IntegerField, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Client, Contract, Event
+
+
+def rollup_of(queryset, aggregate, output_field):
+    """Subquery of 'aggregate' over the rows of 'queryset' of the outer client."""
+    rows = queryset.filter(client=OuterRef('pk')).order_by().values('client').annotate(value=aggregate)
+    return Subquery(rows.values('value'), output_field=output_field)
+
+
+def client_rollups(today=None):
+    today = today or timezone.localdate()
+    return {
+        'contract_count': Coalesce(rollup_of(Contract.objects.all(), Count('id'), IntegerField()), Value(0)),
+        'signed_amount': Coalesce(
+            rollup_of(Contract.objects.filter(status='signed'), Sum('amount'), FloatField()), Value(0.0)),
+        'next_event_date': rollup_of(Event.objects.filter(event_date__gte=today), Min('event_date'), None),
+    }
+
+
+def refresh_client_rollups(client_ids, today=None):
+    """
+    Recompute the rollups of the clients from their contracts and events.
+
+    The client rows are locked first: a concurrent refresh of the same client
+    waits for this transaction, then reads the contracts and events it wrote.
+    date_updated moves with the rollups, for the ETags of the client views.
+    """
+    client_ids = sorted({client_id for client_id in client_ids if client_id is not None})
+    if not client_ids:
+        return 0
+    with transaction.atomic():
+        clients = Client.objects.filter(id__in=client_ids)
+        list(clients.select_for_update().values_list('id', flat=True))
+        return clients.update(date_updated=timezone.now(), **client_rollups(today))
+
+
+def refresh_past_next_events(today=None, batch_size=1000):
+    """
+    Move 'next_event_date' of the clients whose next event is over, it only
+    changes with the events otherwise. Run daily, e.g. from cron.
+    """
+    today = today or timezone.localdate()
+    refreshed = 0
+    while True:
+        # Refreshed clients get a later date or NULL, each pass moves past them.
+        client_ids = list(Client.objects.filter(next_event_date__lt=today)
+                          .order_by('next_event_date', 'id').values_list('id', flat=True)[:batch_size])
+        if not client_ids:
+            return refreshed
+        refreshed += refresh_client_rollups(client_ids, today)
+
+
+def rebuild_client_rollups(batch_size=1000, today=None):
+    """Recompute the rollups of every client, in batches by id."""
+    last_id, refreshed = 0, 0
+    while True:
+        client_ids = list(Client.objects.filter(id__gt=last_id).order_by('id')
+                          .values_list('id', flat=True)[:batch_size])
+        if not client_ids:
+            return refreshed
+        refreshed += refresh_client_rollups(client_ids, today)
+        last_id = client_ids[-1]
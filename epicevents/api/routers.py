@@ -0,0 +1,114 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Routing of the request being handled, set by ReplicaRoutingMiddleware.
+current_routing = ContextVar('current_routing', default=None)
+
+
+def replica_aliases():
+    return tuple(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+class Routing:
+    """
+    Databases of one request: its reads go to 'replica' until it writes,
+    then to the primary, as the reads of a request which isn't safe.
+    """
+
+    def __init__(self, primary):
+        replicas = replica_aliases()
+        self.primary = primary or not replicas
+        self.replica = DEFAULT_DB_ALIAS if self.primary else random.choice(replicas)
+        self.wrote = False
+
+
+def reading_replica():
+    """True when the reads of the current request go to a replica."""
+    routing = current_routing.get()
+    return routing is not None and not routing.primary
+
+
+class ReplicaRouter:
+    """
+    Send the reads of safe requests (GET, HEAD, OPTIONS) to one of the
+    DATABASE_REPLICAS, everything else to the primary ('default').
+
+    Reads stay on the primary outside of a request (management commands,
+    tests without the middleware), inside a transaction of the primary
+    (select_for_update() must lock its rows) and once the request wrote.
+    A client that just wrote is pinned to the primary for
+    REPLICA_PIN_SECONDS (see ReplicaRoutingMiddleware), so it reads its
+    writes while the replicas catch up.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None or routing.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related rows of an instance come from the database it was read from.
+            return instance._state.db
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.wrote = routing.primary = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get the schema from the primary.
+        return False if db in replica_aliases() else None
+
+
+class PrimaryPins:
+    """
+    Clients pinned to the primary, by a hash of their credentials (the
+    Authorization header, else the session cookie, else the IP address),
+    in the REPLICA_PIN_CACHE_ALIAS cache shared by the server processes.
+    """
+    cache_format = 'api:primary-pin:{ident}'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def key(self, request, response=None):
+        session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+            # A login sends a new session key, the next requests come with it.
+            session = response.cookies[settings.SESSION_COOKIE_NAME].value
+        ident = request.META.get('HTTP_AUTHORIZATION') or session or request.META.get('REMOTE_ADDR', '')
+        return self.cache_format.format(ident=hashlib.sha1(ident.encode()).hexdigest())
+
+    def pinned(self, request):
+        return self.cache.get(self.key(request)) is not None
+
+    async def apinned(self, request):
+        return await self.cache.aget(self.key(request)) is not None
+
+    def pin(self, request, response):
+        self.cache.set(self.key(request, response), 1, timeout=self.timeout)
+
+    async def apin(self, request, response):
+        await self.cache.aset(self.key(request, response), 1, timeout=self.timeout)
+
+
+primary_pins = PrimaryPins()
@@ -0,0 +1,47 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+# Same document as the expression indexes of migration 0003.
+DOCUMENT = ('("api_client"."firstname" || \' \' || "api_client"."lastname" || \' \' || '
+            '"api_client"."email" || \' \' || "api_client"."company_name")')
+TSVECTOR = f"to_tsvector('simple', {DOCUMENT})"
+
+
+def search_clients(queryset, text):
+    """
+    Filter clients matching every word of 'text' (as a prefix) in their
+    firstname, lastname, email or company name, annotated with a 'search_rank'.
+
+    PostgreSQL uses the tsvector and trigram GIN indexes, the trigram word
+    similarity also matches misspelled words. SQLite uses the FTS5 table
+    api_client_fts, other databases fall back to icontains.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        raise ValueError("Search needs at least one letter or digit.")
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        matches = RawSQL(f"({TSVECTOR} @@ to_tsquery('simple', %s) OR %s <%% {DOCUMENT})",
+                         (tsquery, text), output_field=BooleanField())
+        rank = RawSQL(f"greatest(ts_rank({TSVECTOR}, to_tsquery('simple', %s)), word_similarity(%s, {DOCUMENT}))",
+                      (tsquery, text), output_field=FloatField())
+    elif vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        matches = RawSQL("api_client.id IN (SELECT rowid FROM api_client_fts WHERE api_client_fts MATCH %s)",
+                         (match,), output_field=BooleanField())
+        rank = RawSQL("(SELECT -bm25(api_client_fts) FROM api_client_fts "
+                      "WHERE api_client_fts MATCH %s AND rowid = api_client.id)",
+                      (match,), output_field=FloatField())
+    else:
+        matches = Q()
+        for word in words:
+            matches &= (Q(firstname__icontains=word) | Q(lastname__icontains=word)
+                        | Q(email__icontains=word) | Q(company_name__icontains=word))
+        rank = Value(0.0, output_field=FloatField())
+    return queryset.filter(matches).annotate(search_rank=rank)
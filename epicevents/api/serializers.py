@@ -1,13 +1,74 @@
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from api.models import User, Client, Contract, Event
 
 
-class ClientSerializer(serializers.ModelSerializer):
+def add_user_claims(token, user):
+    """The claims ClaimsJWTAuthentication builds the user from."""
+    token['username'] = user.username
+    token['role'] = user.role
+    token['is_active'] = user.is_active
+    return token
+
+
+class TokenSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class TokenRefreshClaimsSerializer(TokenRefreshSerializer):
+    """
+    A new access token gets the claims of the user as it is now and a new
+    'iat', instead of those copied from the refresh token.
+    """
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        refresh = RefreshToken(attrs['refresh'])
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}).first()
+        if user is None or not user.is_active:
+            raise AuthenticationFailed(_('No active account found with the given credentials'), code='no_active_account')
+        access = add_user_claims(refresh.access_token, user)
+        access.set_iat()
+        data['access'] = str(access)
+        return data
+
+
+class SelectableFieldsMixin:
+    """
+    'fields' keeps only these fields. Meta.sparse_columns maps a field that
+    isn't a model column to the columns it reads, see SparseFieldsMixin, and
+    Meta.sparse_formats the field of several columns to the function
+    formatting them, see RowSerializer.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ClientSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     sale_contact = serializers.StringRelatedField()
     class Meta:
         model = Client
         fields = ['id', 'firstname', 'lastname', 'email', 'phone', 'mobile',
-                  'role', 'company_name', 'date_created', 'date_updated', 'sale_contact']
+                  'role', 'company_name', 'date_created', 'date_updated', 'sale_contact',
+                  'contract_count', 'signed_amount', 'next_event_date']
+        read_only_fields = ['contract_count', 'signed_amount', 'next_event_date']
+        sparse_columns = {'sale_contact': ('sale_contact__username',)}
+
+
+class ClientImportSerializer(ClientSerializer):
+    """Unique email and mobile are checked for a whole batch by the import view."""
+    class Meta(ClientSerializer.Meta):
+        extra_kwargs = {'email': {'validators': []}, 'mobile': {'validators': []}}
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,17 +77,30 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'role', 'lastname']
 
 
-class ContractSerializer(serializers.ModelSerializer):
+class ContractSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     client = serializers.StringRelatedField()
     sales_contact = serializers.StringRelatedField()
     class Meta:
         model = Contract
         fields = ['id', 'date_created', 'date_updated', 'status', 'amount',
                   'payment_due', 'client', 'sales_contact']
+        sparse_columns = {'client': ('client__email',), 'sales_contact': ('sales_contact__username',)}
+
+
+class ContractBatchSerializer(serializers.Serializer):
+    """One change of a batch update, only 'status' and 'payment_due' can change."""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Contract.STATUS_CHOICE, required=False)
+    payment_due = serializers.DateField(required=False, allow_null=True)
 
+    def validate(self, data):
+        unknown = set(self.initial_data) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError(f"Can't change {', '.join(sorted(unknown))}.")
+        return data
 
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     client = serializers.StringRelatedField()
     contract = serializers.StringRelatedField()
     support_contact = serializers.StringRelatedField()
@@ -34,3 +108,9 @@ class EventSerializer(serializers.ModelSerializer):
         model = Event
         fields = ['id', 'date_created', 'date_updated', 'attendees', 'event_date',
                   'notes', 'client', 'support_contact', 'contract']
+        sparse_columns = {
+            'client': ('client__email',),
+            'contract': ('contract__status', 'contract__client__email'),
+            'support_contact': ('support_contact__username',),
+        }
+        sparse_formats = {'contract': Contract.label}
@@ -0,0 +1,80 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .cache import response_cache
+from . import metrics
+from .models import User, Client, Contract, Event, Tombstone
+from .reports import summary_of, move_contract, rebuild_summary
+from .rollups import refresh_client_rollups
+
+
+@receiver(connection_created)
+def count_request_queries(sender, connection, **kwargs):
+    metrics.install(connection)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Contract)
+@receiver(post_delete, sender=Contract)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_cached_lists(sender, instance, **kwargs):
+    response_cache.invalidate(sender._meta.model_name)
+
+
+@receiver(pre_save, sender=Contract)
+def load_contract_summary(sender, instance, **kwargs):
+    if instance._state.adding or getattr(instance, '_summary', None) is not None:
+        return
+    old = Contract.objects.filter(pk=instance.pk) \
+        .values_list('sales_contact_id', 'status', 'payment_due', 'amount', 'client_id').first()
+    instance._summary = old and old[:4]
+    instance._loaded_client_id = old and old[4]
+
+
+@receiver(post_save, sender=Contract)
+def update_sales_summary(sender, instance, created, **kwargs):
+    old = None if created else instance._summary
+    move_contract(old, summary_of(instance))
+    instance.remember_summary()
+
+
+@receiver(post_delete, sender=Contract)
+def remove_from_sales_summary(sender, instance, **kwargs):
+    summary = getattr(instance, '_summary', None)
+    move_contract(summary if summary is not None else summary_of(instance), None)
+    instance._summary = None
+
+
+@receiver(post_save, sender=Contract)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+def update_client_rollups(sender, instance, **kwargs):
+    # Both clients when the contract or event moved from one to another.
+    refresh_client_rollups([instance.client_id, getattr(instance, '_loaded_client_id', None)])
+    instance._loaded_client_id = instance.client_id
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contract)
+@receiver(post_delete, sender=Event)
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(model_name=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def merge_orphan_sales_summary(sender, instance, **kwargs):
+    # The seller's rows and contracts were set to NULL, fold them into the existing NULL rows.
+    rebuild_summary([None])
@@ -0,0 +1,115 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Tombstone
+from .pagination import KeysetPagination
+
+
+# Rows changed less than SYNC_LAG_SECONDS ago are left to the next poll: a
+# transaction still running when a poll reads the table commits rows dated
+# before the end of that poll, they would be behind its watermark.
+SYNC_LAG_SECONDS = getattr(settings, 'SYNC_LAG_SECONDS', 5)
+
+# Tombstones are kept SYNC_TOMBSTONE_DAYS days ('manage.py purge_tombstones'),
+# an older watermark has to sync again from scratch.
+SYNC_TOMBSTONE_DAYS = getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30)
+
+
+def keyset(*ordering):
+    paginator = KeysetPagination()
+    paginator.ordering = ordering
+    return paginator
+
+
+class Watermark:
+    """
+    Position of a sync client: the (date_updated, id) of the last changed
+    row and the (date_deleted, id) of the last tombstone it read, sent back
+    as an opaque token.
+    """
+    changes = keyset('date_updated', 'id')
+    deletions = keyset('date_deleted', 'id')
+
+    def __init__(self, updated=None, deleted=None):
+        self.updated = updated
+        self.deleted = deleted
+
+    @classmethod
+    def start(cls, horizon):
+        # A first sync reads every row, then the tombstones written since it started.
+        return cls(deleted=(horizon, 0))
+
+    @classmethod
+    def decode(cls, token):
+        """Raise ValueError when the token isn't one of encode()."""
+        try:
+            updated, deleted = json.loads(urlsafe_b64decode(token.encode('ascii')))
+            updated = None if updated is None else cls.position(updated)
+            deleted = cls.position(deleted)
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError('Invalid updated_since watermark.')
+        return cls(updated, deleted)
+
+    @staticmethod
+    def position(value):
+        """An encoded [aware date-time, id] pair."""
+        if not isinstance(value, list) or len(value) != 2 or not isinstance(value[0], str) \
+                or not isinstance(value[1], int) or isinstance(value[1], bool):
+            raise ValueError(value)
+        moment = parse_datetime(value[0])
+        if moment is None or timezone.is_naive(moment):
+            raise ValueError(value)
+        return moment, value[1]
+
+    def expired(self):
+        """Tombstones after the watermark may have been purged."""
+        return self.deleted[0] < timezone.now() - datetime.timedelta(days=SYNC_TOMBSTONE_DAYS)
+
+    def encode(self):
+        updated = self.updated and [self.updated[0].isoformat(), self.updated[1]]
+        deleted = [self.deleted[0].isoformat(), self.deleted[1]]
+        return urlsafe_b64encode(json.dumps([updated, deleted]).encode('utf-8')).decode('ascii')
+
+
+def sync_horizon(now=None):
+    return (now or timezone.now()) - datetime.timedelta(seconds=SYNC_LAG_SECONDS)
+
+
+def read_changes(queryset, watermark, size, horizon):
+    """
+    The rows changed after the watermark and before the horizon, at most
+    'size', in (date_updated, id) order: a range scan of the
+    (date_updated, id) index. Returns (rows, more).
+    """
+    queryset = queryset.filter(date_updated__lt=horizon).order_by('date_updated', 'id')
+    if watermark.updated is not None:
+        queryset = queryset.filter(Watermark.changes.position_filter(watermark.updated))
+    rows = list(queryset[:size + 1])
+    return rows[:size], len(rows) > size
+
+
+def read_deletions(model_name, watermark, size, horizon):
+    """The tombstones of the model after the watermark, like read_changes()."""
+    tombstones = list(
+        Tombstone.objects.filter(model_name=model_name, date_deleted__lt=horizon)
+        .filter(Watermark.deletions.position_filter(watermark.deleted))
+        .order_by('date_deleted', 'id').values_list('date_deleted', 'id', 'object_id')[:size + 1])
+    return tombstones[:size], len(tombstones) > size
+
+
+def advance(watermark, rows, tombstones):
+    updated = (rows[-1].date_updated, rows[-1].id) if rows else watermark.updated
+    deleted = tombstones[-1][:2] if tombstones else watermark.deleted
+    return Watermark(updated, deleted)
+
+
+def purge_tombstones(days=None):
+    days = SYNC_TOMBSTONE_DAYS if days is None else days
+    deleted, _ = Tombstone.objects.filter(
+        date_deleted__lt=timezone.now() - datetime.timedelta(days=days)).delete()
+    return deleted
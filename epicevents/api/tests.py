@@ -1,3 +1,1124 @@
-from django.test import TestCase
+import csv
+import json
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import urlsafe_b64encode
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import metrics, views
+from .authentication import user_cache
+from .mixins import QueryBudgetExceeded
+from .middleware import ReplicaRoutingMiddleware
+from .models import User, Client, Contract, Event, SalesSummary
+from .rendering import render_json
+from .reports import aggregate_contracts, rebuild_summary, sales_report
+from .rollups import rebuild_client_rollups, refresh_past_next_events
+from .routers import ReplicaRouter, Routing, current_routing, primary_pins
+from .sync import Watermark
+from .throttling import parse_rate
+
+
+class APIData:
+    """A seller with 6 clients and contracts (odd ones signed, with an event), a support user and a manager."""
+
+    @classmethod
+    def create_rows(cls):
+        cls.seller = User.objects.create_user('seller', 'seller', 'pw')
+        cls.support = User.objects.create_user('support', 'support', 'pw')
+        cls.manager = User.objects.create_user('manager', 'manager', 'pw')
+        cls.clients = [Client.objects.create(
+            firstname=f'First{i}', lastname=f'Last{i % 3}', email=f'client{i}@example.com',
+            mobile=f'06{i:08d}', company_name=f'Company{i}', sale_contact=cls.seller) for i in range(6)]
+        cls.contracts = [Contract.objects.create(
+            client=client, amount=100.0 * (i % 4), status='signed' if i % 2 else 'unsigned',
+            sales_contact=cls.seller, payment_due=datetime.date(2022, 1 + i, 1)) for i, client in enumerate(cls.clients)]
+        cls.events = [Event.objects.create(
+            client=contract.client, contract=contract, attendees=10, event_date=datetime.date(2022, 2, 1 + i),
+            notes='Notes', support_contact=cls.support) for i, contract in enumerate(cls.contracts) if contract.status == 'signed']
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        user_cache.clear()
+
+    def token(self, user):
+        response = APIClient().post('/api/v1/signin/', {'username': user.username, 'password': 'pw'}, format='json')
+        return response.data['access']
+
+    def api(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token(user)}')
+        return client
+
+    def ids(self, response):
+        return [row['id'] for row in response.data['results']]
+
+    def assertSummaryMatches(self):
+        usernames = dict(User.objects.values_list('id', 'username'))
+        live = {(usernames.get(row['sales_contact_id']), row['status'], row['month'] and row['month'].strftime('%Y-%m')):
+                (row['contracts'], round(row['amount'], 2)) for row in aggregate_contracts(Contract.objects.all())}
+        report = {(line['seller'], line['status'], line['month']): (line['contracts'], line['amount'])
+                  for line in sales_report(['seller', 'status', 'month'])}
+        self.assertEqual(report, live)
+
+
+class APITestCase(APIData, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_rows()
+
+
+class KeysetPaginationTest(APITestCase):
+
+    def pages(self, url, user=None):
+        client, ids = self.api(user or self.seller), []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += self.ids(response)
+            url = response.data['next']
+        return ids
+
+    def test_pages_follow_the_ordering(self):
+        for url, model in (('/api/v1/clients/?page_size=2', Client),
+                           ('/api/v1/contracts/?page_size=2', Contract),
+                           ('/api/v1/events/?page_size=2', Event)):
+            with self.subTest(url=url):
+                expected = list(model.objects.order_by('date_created', 'id').values_list('id', flat=True))
+                self.assertEqual(self.pages(url), expected)
+
+    def test_rows_created_while_paging_are_not_repeated(self):
+        client = self.api(self.seller)
+        first = client.get('/api/v1/clients/?page_size=2')
+        Client.objects.create(firstname='New', lastname='New', email='new@example.com', mobile='0700000000',
+                              sale_contact=self.seller)
+        ids = self.ids(first) + self.pages(first.data['next'])
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), set(Client.objects.values_list('id', flat=True)))
+
+    def test_invalid_cursor_and_page_size(self):
+        client = self.api(self.seller)
+        self.assertEqual(client.get('/api/v1/clients/?cursor=invalid').status_code, 404)
+        self.assertEqual(client.get('/api/v1/clients/?page_size=many').status_code, 404)
+
+
+class QueryBudgetTest(APITestCase):
+
+    def add_rows(self):
+        for i in range(6, 12):
+            client = Client.objects.create(firstname='More', lastname='More', email=f'client{i}@example.com',
+                                           mobile=f'06{i:08d}', sale_contact=self.seller)
+            contract = Contract.objects.create(client=client, amount=10, status='signed', sales_contact=self.seller)
+            Event.objects.create(client=client, contract=contract, attendees=1, event_date=datetime.date(2022, 3, 1),
+                                 notes='Notes', support_contact=self.support)
+
+    def test_lists_within_budget_whatever_their_size(self):
+        client = self.api(self.seller)
+        urls = ('/api/v1/clients/', '/api/v1/contracts/', '/api/v1/events/')
+        counts = {}
+        for url in urls:
+            response = client.get(url)
+            self.assertLessEqual(int(response['X-Query-Count']), int(response['X-Query-Budget']))
+            counts[url] = response['X-Query-Count']
+        self.add_rows()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url)['X-Query-Count'], counts[url])
+
+    def test_details_within_budget(self):
+        for user, url in ((self.seller, f'/api/v1/clients/{self.clients[0].id}'),
+                          (self.seller, f'/api/v1/contracts/{self.contracts[1].id}'),
+                          (self.support, f'/api/v1/events/{self.events[0].id}')):
+            with self.subTest(url=url):
+                response = self.api(user).get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(int(response['X-Query-Count']), int(response['X-Query-Budget']))
+
+    def test_over_budget(self):
+        client = self.api(self.seller)
+        with mock.patch.object(views.ClientList, 'query_budget', {'GET': 0}):
+            with override_settings(QUERY_BUDGET_ENFORCE=True), self.assertRaises(QueryBudgetExceeded):
+                client.get('/api/v1/clients/')
+            with override_settings(QUERY_BUDGET_ENFORCE=False), self.assertLogs('api.mixins', 'WARNING'):
+                self.assertEqual(client.get('/api/v1/clients/?page_size=3').status_code, 200)
+
+    def test_enforced_only_by_the_tests(self):
+        self.assertTrue(settings.QUERY_BUDGET_ENFORCE)
+        script = 'from django.conf import settings; print(settings.QUERY_BUDGET_ENFORCE)'
+        environ = {name: value for name, value in os.environ.items() if name != 'QUERY_BUDGET_ENFORCE'}
+        for env, expected in (({}, 'False'), ({'QUERY_BUDGET_ENFORCE': '1'}, 'True')):
+            output = subprocess.run(
+                [sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                env={**environ, 'DJANGO_SETTINGS_MODULE': 'epicevents.settings', **env})
+            self.assertEqual(output.stdout.strip(), expected)
+
+
+class FilterSetTest(APITestCase):
+
+    def test_filters(self):
+        client = self.api(self.seller)
+        response = client.get('/api/v1/contracts/?amount__between=100,200&status=signed')
+        self.assertEqual(sorted(self.ids(response)), sorted(
+            contract.id for contract in self.contracts if contract.status == 'signed' and 100 <= contract.amount <= 200))
+        response = client.get('/api/v1/events/?event_date__gte=2022-02-03')
+        self.assertEqual(sorted(self.ids(response)), sorted(
+            event.id for event in self.events if event.event_date >= datetime.date(2022, 2, 3)))
+        response = client.get('/api/v1/clients/?lastname__in=Last0,Last1')
+        self.assertEqual(sorted(self.ids(response)), sorted(
+            client.id for client in self.clients if client.lastname in ('Last0', 'Last1')))
+
+    def test_date_created(self):
+        client, today = self.api(self.seller), timezone.localdate()
+        response = client.get(f'/api/v1/contracts/?date_created={today.isoformat()}')
+        self.assertEqual(len(response.data['results']), len(self.contracts))
+        response = client.get(f'/api/v1/contracts/?date_created__lt={today.isoformat()}')
+        self.assertEqual(response.data['results'], [])
+
+    def test_ordering_with_cursor(self):
+        client, url, ids = self.api(self.seller), '/api/v1/contracts/?ordering=-amount&page_size=2', []
+        while url:
+            response = client.get(url)
+            ids += self.ids(response)
+            url = response.data['next']
+        self.assertEqual(ids, list(Contract.objects.order_by('-amount', '-id').values_list('id', flat=True)))
+
+    def test_validation_errors(self):
+        client = self.api(self.seller)
+        for url in ('/api/v1/events/?event_date=bad',
+                    '/api/v1/events/?event_date__between=2022-01-01',
+                    '/api/v1/contracts/?amount__gte=many',
+                    '/api/v1/contracts/?status__gte=signed',
+                    '/api/v1/events/?ordering=notes'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('detail', response.data)
+
+
+class AccessPathTest(TestCase):
+
+    def test_list_filters_use_an_index(self):
+        call_command('seed_data', clients=300, sellers=2, supports=2, random_seed=1, stdout=StringIO())
+        output = StringIO()
+        call_command('explain_filters', stdout=output)
+        self.assertNotIn('FULL SCAN', output.getvalue())
+
+
+class ClaimsAuthenticationTest(APITestCase):
+
+    def test_no_query_to_authenticate(self):
+        client = self.api(self.seller)
+        user_cache.clear()
+        with self.assertNumQueries(1):
+            response = client.get(f'/api/v1/clients/{self.clients[0].id}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivated_user(self):
+        client = self.api(self.seller)
+        self.assertEqual(client.get(f'/api/v1/clients/{self.clients[0].id}').status_code, 200)
+        self.seller.is_active = False
+        self.seller.save()
+        self.assertEqual(client.get(f'/api/v1/clients/{self.clients[0].id}').status_code, 401)
+
+    def test_demoted_user(self):
+        client = self.api(self.seller)
+        self.assertEqual(client.post('/api/v1/clients/', {}, format='json').status_code, 400)
+        self.seller.role = 'support'
+        self.seller.save()
+        self.assertEqual(client.post('/api/v1/clients/', {}, format='json').status_code, 403)
+
+
+    def test_change_from_another_process(self):
+        client, url = self.api(self.seller), f'/api/v1/clients/{self.clients[0].id}'
+        self.assertEqual(client.get(url).status_code, 200)
+        # Another process saved the user: only its mark in the shared cache is seen here.
+        User.objects.filter(id=self.seller.id).update(is_active=False)
+        user_cache.cache.set(user_cache.changed_format.format(user_id=self.seller.id), time.time())
+        self.assertEqual(client.get(url).status_code, 401)
+
+    def test_change_outlives_the_other_caches(self):
+        client, url = self.api(self.seller), f'/api/v1/clients/{self.clients[0].id}'
+        self.seller.is_active = False
+        self.seller.save()
+        user_cache.clear()
+        # The list pages and throttle buckets fill the default cache past its MAX_ENTRIES.
+        caches['default'].set_many({f'filler:{i}': i for i in range(10001)})
+        self.assertIsNot(user_cache.cache, caches['default'])
+        self.assertEqual(client.get(url).status_code, 401)
+
+    def test_refresh_reloads_claims(self):
+        tokens = APIClient().post('/api/v1/signin/', {'username': 'seller', 'password': 'pw'}, format='json').data
+        self.seller.role = 'support'
+        self.seller.save()
+        response = APIClient().post('/api/v1/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'support')
+        self.seller.is_active = False
+        self.seller.save()
+        response = APIClient().post('/api/v1/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+class BulkImportTest(APITestCase):
+    header = b'firstname,lastname,email,phone,mobile,company_name\n'
+
+    def row(self, i):
+        return f'Imported,Client,imported{i}@example.com,01{i:08d},07{i:08d},Company\n'.encode()
+
+    def post(self, url, body, content_type='text/csv'):
+        return self.api(self.seller).post(url, body, content_type=content_type)
+
+    def test_created(self):
+        response = self.post('/api/v1/clients/import/', self.header + self.row(1) + self.row(2))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 2, 'errors': []})
+        self.assertEqual(Client.objects.filter(email__startswith='imported', sale_contact=self.seller).count(), 2)
+
+    def test_errors_by_line(self):
+        body = self.header + self.row(1) + self.row(1) + b'No,Email,,0100,0700,Company\n' + self.row(2)
+        response = self.post('/api/v1/clients/import/', body)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4])
+        self.assertIn('email', response.data['errors'][0]['errors'])
+
+    def test_statuses(self):
+        body = (self.header + self.row(1) + self.row(1) + b'No,Email,,0100,0700,Company\n' + self.row(2)
+                + b'Caf\xe9,Client,cafe@example.com,0100000009,0700000009,Company\n' + self.row(3))
+        response = self.post('/api/v1/clients/import/', body)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4, 6])
+        response = self.post('/api/v1/clients/import/', self.header + self.row(1))
+        self.assertEqual((response.status_code, response.data['created']), (400, 0))
+        response = self.post('/api/v1/clients/import/', b'')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['detail'], "There isn't any row to import.")
+
+    def test_ndjson(self):
+        body = (b'{"client_email": "client0@example.com", "amount": 50, "payment_due": "2022-06-01"}\n'
+                b'not json\n'
+                b'{"client_email": "unknown@example.com", "amount": 50}\n')
+        response = self.post('/api/v1/contracts/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 3])
+        self.assertTrue(Contract.objects.filter(client=self.clients[0], amount=50, status='unsigned').exists())
+
+    def test_events(self):
+        contract = Contract.objects.create(client=self.clients[0], amount=10, status='signed', sales_contact=self.seller)
+        body = (f'{{"contract_id": {contract.id}, "client_email": "client0@example.com", '
+                f'"attendees": 5, "event_date": "2022-05-01", "notes": "Notes"}}\n'
+                f'{{"contract_id": {self.contracts[1].id}, "client_email": "client1@example.com", '
+                f'"attendees": 5, "event_date": "2022-05-01", "notes": "Notes"}}\n').encode()
+        response = self.post('/api/v1/events/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2])
+        self.assertEqual(Event.objects.filter(contract=contract).count(), 1)
+
+
+class ExportTest(APITestCase):
+
+    def export(self, url):
+        response = self.api(self.seller).get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, content = self.export('/api/v1/contracts/?export=ndjson&status=signed')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [contract.id for contract in self.contracts if contract.status == 'signed'])
+
+    def test_csv(self):
+        response, content = self.export('/api/v1/clients/?export=csv')
+        self.assertIn('filename="clients.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual([row['email'] for row in rows], [client.email for client in self.clients])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.api(self.seller).get('/api/v1/clients/?export=xml').status_code, 404)
+
+
+class ConditionalGetTest(APITestCase):
+
+    def test_not_modified(self):
+        client = self.api(self.seller)
+        for url in (f'/api/v1/contracts/{self.contracts[1].id}', '/api/v1/contracts/?page_size=2'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_changed_row(self):
+        client, url = self.api(self.seller), f'/api/v1/contracts/{self.contracts[1].id}'
+        etag = client.get(url)['ETag']
+        contract = Contract.objects.get(id=self.contracts[1].id)
+        contract.amount = 1234
+        contract.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['amount'], 1234)
+
+    def test_last_modified(self):
+        client, url = self.api(self.seller), f'/api/v1/clients/{self.clients[0].id}'
+        last_modified = client.get(url)['Last-Modified']
+        self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        Client.objects.filter(id=self.clients[0].id).update(
+            date_updated=timezone.now() + datetime.timedelta(seconds=2))
+        self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_last_modified_of_related_rows(self):
+        client, url = self.api(self.seller), f'/api/v1/contracts/{self.contracts[1].id}'
+        last_modified = client.get(url)['Last-Modified']
+        Client.objects.filter(id=self.clients[1].id).update(
+            date_updated=timezone.now() + datetime.timedelta(seconds=2))
+        response = client.get(url)
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(last_modified))
+        self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_changed_related_row(self):
+        client, url = self.api(self.seller), f'/api/v1/contracts/{self.contracts[1].id}'
+        response = client.get(url)
+        customer = Client.objects.get(id=self.clients[1].id)
+        customer.email = 'renamed@example.com'
+        customer.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['client'], 'renamed@example.com')
+
+
+class ListCacheTest(APITestCase):
+
+    def test_hit_then_invalidated_by_a_write(self):
+        client, url = self.api(self.seller), '/api/v1/contracts/?status=signed'
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+        response = client.get(url)
+        self.assertEqual((response['X-Cache'], response['X-Query-Count']), ('HIT', '0'))
+
+        contract = Contract.objects.get(id=self.contracts[1].id)
+        contract.amount = 4321
+        contract.save()
+        response = client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn(4321, [row['amount'] for row in response.data['results']])
+
+    def test_related_model_write(self):
+        client, url = self.api(self.seller), '/api/v1/contracts/'
+        client.get(url)
+        client_row = Client.objects.get(id=self.clients[0].id)
+        client_row.email = 'changed@example.com'
+        client_row.save()
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+
+    def test_per_user(self):
+        url = '/api/v1/clients/'
+        self.assertEqual(self.api(self.seller).get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.api(self.manager).get(url)['X-Cache'], 'MISS')
+
+
+class SearchTest(APITestCase):
+
+    def search(self, text, **params):
+        return self.api(self.seller).get('/api/v1/clients/', {'search': text, **params})
+
+    def test_prefix_search(self):
+        response = self.search('compan first3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response), [self.clients[3].id])
+
+    def test_ranked(self):
+        weak = Client.objects.create(firstname='Bob', lastname='Stone', email='bob@example.com', mobile='0700000001',
+                                     company_name='Alpha', sale_contact=self.seller)
+        strong = Client.objects.create(firstname='Alpha', lastname='Alpha', email='alpha@example.com',
+                                       mobile='0700000002', company_name='Alpha', sale_contact=self.seller)
+        self.assertEqual(self.ids(self.search('alpha')), [strong.id, weak.id])
+
+    def test_search_without_words(self):
+        self.assertEqual(self.search('--').status_code, 404)
+
+
+    def test_after_update(self):
+        client = self.clients[2]
+        client.lastname = 'Renamed'
+        client.save()
+        self.assertEqual(self.ids(self.search('renamed')), [client.id])
+        self.assertNotIn(client.id, self.ids(self.search('last2')))
+
+
+class SalesSummaryTest(APITestCase):
+
+    def test_summary_follows_the_contracts(self):
+        self.assertSummaryMatches()
+        contract = Contract.objects.get(id=self.contracts[0].id)
+        contract.status, contract.amount, contract.payment_due = 'signed', 999, datetime.date(2023, 1, 15)
+        contract.save()
+        Contract.objects.get(id=self.contracts[1].id).delete()
+        self.api(self.seller).post('/api/v1/contracts/import/', b'{"client_email": "client3@example.com", "amount": 50}\n',
+                                   content_type='application/x-ndjson')
+        self.assertSummaryMatches()
+        rebuild_summary()
+        self.assertSummaryMatches()
+
+    def test_keys_without_seller_or_month(self):
+        for sales_contact, payment_due in ((None, None), (None, None), (self.seller, None), (None, datetime.date(2022, 1, 9))):
+            Contract.objects.create(client=self.clients[0], amount=5, sales_contact=sales_contact, payment_due=payment_due)
+        self.assertEqual(SalesSummary.objects.filter(sales_contact=None, status='unsigned', month=None).get().contracts, 2)
+        self.assertSummaryMatches()
+        for key in ({'sales_contact': None, 'month': None}, {'sales_contact': self.seller, 'month': None},
+                    {'sales_contact': None, 'month': datetime.date(2022, 1, 1)}):
+            with self.subTest(key=key), self.assertRaises(IntegrityError), transaction.atomic():
+                SalesSummary.objects.create(status='unsigned', **key)
+
+    def test_migration_backfill(self):
+        Contract.objects.create(client=self.clients[0], amount=5, sales_contact=None, payment_due=None)
+        SalesSummary.objects.all().delete()
+        import_module('api.migrations.0004_sales_summary').backfill_summary(django_apps, None)
+        self.assertSummaryMatches()
+
+    def test_report(self):
+        response = self.api(self.manager).get('/api/v1/reports/sales/?group_by=status')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'status': 'signed', 'contracts': 3, 'amount': 500.0},
+            {'status': 'unsigned', 'contracts': 3, 'amount': 200.0}])
+        response = self.api(self.manager).get('/api/v1/reports/sales/?group_by=month&status=signed&month__gte=2022-04')
+        self.assertEqual(response.data['results'], [
+            {'month': '2022-04', 'contracts': 1, 'amount': 300.0},
+            {'month': '2022-06', 'contracts': 1, 'amount': 100.0}])
+
+    def test_report_errors(self):
+        self.assertEqual(self.api(self.manager).get('/api/v1/reports/sales/?group_by=day').status_code, 404)
+        self.assertEqual(self.api(self.seller).get('/api/v1/reports/sales/').status_code, 403)
+
+
+class AsyncViewsTest(APIData, TransactionTestCase):
+    # The async views run the ORM in their own threads, which don't see the rows of a TestCase transaction.
+
+    def setUp(self):
+        super().setUp()
+        self.create_rows()
+        self.authorization = f'Bearer {self.token(self.seller)}'
+        self.expected = self.ids(self.api(self.seller).get('/api/v1/contracts/?status=signed'))
+
+    def get(self, path, authenticated=True):
+        # AsyncClient sends its extra keyword arguments as headers.
+        headers = {'AUTHORIZATION': self.authorization} if authenticated else {}
+        return self.async_client.get(path, **headers)
+
+    async def test_list_and_detail(self):
+        response = await self.get('/api/v1/async/contracts/?status=signed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], self.expected)
+        response = await self.get(f'/api/v1/async/clients/{self.clients[0].id}')
+        self.assertEqual(response.json()['email'], self.clients[0].email)
+
+    async def test_errors(self):
+        response = await self.get('/api/v1/async/clients/', authenticated=False)
+        self.assertEqual(response.status_code, 401)
+        response = await self.get('/api/v1/async/clients/?export=csv')
+        self.assertEqual(response.status_code, 404)
+
+
+    async def test_user_change_read_without_blocking(self):
+        def deactivate():
+            self.seller.is_active = False
+            self.seller.save()
+            user_cache.clear()
+        # A sync cache read would block the event loop.
+        with mock.patch.object(user_cache, 'changed_at', side_effect=AssertionError('changed_at() on the event loop')):
+            response = await self.get(f'/api/v1/async/clients/{self.clients[0].id}')
+            self.assertEqual(response.status_code, 200)
+            await sync_to_async(deactivate)()
+            response = await self.get(f'/api/v1/async/clients/{self.clients[0].id}')
+            self.assertEqual(response.status_code, 401)
+
+class BenchmarkTest(TransactionTestCase):
+    # The benchmark sends its requests from a thread pool.
+
+    @override_settings(METRICS_TOKEN='benchmark')
+    def test_every_route(self):
+        call_command('seed_data', clients=300, sellers=2, supports=2, random_seed=1, stdout=StringIO())
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_api', requests=2, concurrency=1, warmup=0, writes=True,
+                         output=output.name, stdout=StringIO())
+            report = json.load(output)
+        self.assertEqual(report['rows']['client'], Client.objects.count())
+        routes = {(result['route'], result['method']) for result in report['results']}
+        self.assertIn(('events/<int:pk>', 'GET'), routes)
+        self.assertIn(('events/import/', 'POST'), routes)
+        for result in report['results']:
+            with self.subTest(route=result['route'], method=result['method']):
+                self.assertEqual(result['errors'], 0, result['statuses'])
+                self.assertEqual(result['requests'], 2)
+
+
+class MetricsTest(APITestCase):
+    labels = ('api/v1/clients/<int:pk>', 'api.views.ClientDetail', 'GET')
+
+    def test_request_recorded(self):
+        requests = metrics.requests_total.values.get(self.labels + ('200',), 0)
+        queries = metrics.db_queries.values.get(self.labels, ([], 0))[1]
+        self.api(self.seller).get(f'/api/v1/clients/{self.clients[0].id}')
+        self.assertEqual(metrics.requests_total.values[self.labels + ('200',)], requests + 1)
+        self.assertGreaterEqual(metrics.db_queries.values[self.labels][1], queries + 1)
+
+    @override_settings(METRICS_TOKEN='scraper')
+    def test_endpoint(self):
+        self.api(self.seller).get(f'/api/v1/clients/{self.clients[0].id}')
+        response = APIClient().get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('api_requests_total{route="api/v1/clients/<int:pk>",view="api.views.ClientDetail",'
+                      'method="GET",status="200"}', response.content.decode())
+        # Behind a proxy every request comes from its address, it proves nothing.
+        self.assertEqual(APIClient().get('/api/v1/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(APIClient().get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+        self.assertEqual(self.api(self.seller).get('/api/v1/metrics/').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_for_staff(self):
+        self.assertEqual(APIClient().get('/api/v1/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        client = APIClient()
+        client.force_login(User.objects.create_superuser('admin', 'pw'))
+        self.assertEqual(client.get('/api/v1/metrics/').status_code, 200)
+
+    def test_export_recorded_once_sent(self):
+        labels = ('api/v1/contracts/', 'api.views.ContractList', 'GET')
+        requests = metrics.requests_total.values.get(labels + ('200',), 0)
+        queries = metrics.db_queries.values.get(labels, ([], 0))[1]
+        response = self.api(self.seller).get('/api/v1/contracts/?export=ndjson')
+        self.assertEqual(metrics.requests_total.values.get(labels + ('200',), 0), requests)
+        rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), len(self.contracts))
+        self.assertEqual(metrics.requests_total.values[labels + ('200',)], requests + 1)
+        # The stream reads the rows after the view returned, its queries are counted too.
+        self.assertGreaterEqual(metrics.db_queries.values[labels][1], queries + 1)
+
+class VisibilityTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user('other', 'seller', 'pw')
+        cls.other_client = Client.objects.create(firstname='Other', lastname='Other', email='other@example.com',
+                                                 mobile='0799999999', sale_contact=cls.other)
+        cls.other_contract = Contract.objects.create(client=cls.other_client, amount=1, status='signed',
+                                                     sales_contact=cls.other)
+
+    def test_responsible_rows(self):
+        for user, url, expected in (
+                (self.seller, '/api/v1/clients/?responsible=1', self.clients),
+                (self.seller, '/api/v1/contracts/?responsible=1', self.contracts),
+                (self.seller, '/api/v1/events/?responsible=1', self.events),
+                (self.support, '/api/v1/events/?responsible=1', self.events),
+                (self.support, '/api/v1/contracts/?responsible=1', [event.contract for event in self.events]),
+                (self.support, '/api/v1/clients/?responsible=1', [event.client for event in self.events]),
+                (self.manager, '/api/v1/contracts/?responsible=1', self.contracts + [self.other_contract])):
+            with self.subTest(user=user.username, url=url):
+                response = self.api(user).get(url)
+                self.assertEqual(sorted(self.ids(response)), sorted(row.id for row in expected))
+                self.assertLessEqual(int(response['X-Query-Count']), int(response['X-Query-Budget']))
+
+    @mock.patch('api.sync.SYNC_LAG_SECONDS', 0)
+    def test_lists_scoped_whatever_responsible(self):
+        for user, url, expected in (
+                (self.seller, '/api/v1/clients/', self.clients),
+                (self.seller, '/api/v1/contracts/?responsible=0', self.contracts),
+                (self.other, '/api/v1/contracts/', [self.other_contract]),
+                (self.support, '/api/v1/events/?responsible=0', self.events),
+                (self.seller, '/api/v1/contracts/sync/', self.contracts),
+                (self.manager, '/api/v1/clients/?responsible=0', self.clients + [self.other_client]),
+                (self.manager, '/api/v1/contracts/', self.contracts + [self.other_contract])):
+            with self.subTest(user=user.username, url=url):
+                response = self.api(user).get(url)
+                self.assertEqual(sorted(row['id'] for row in response.data['results']), sorted(row.id for row in expected))
+
+    def test_invalid_responsible(self):
+        self.assertEqual(self.api(self.seller).get('/api/v1/clients/?responsible=2').status_code, 404)
+
+    def test_update_of_another_seller_row(self):
+        response = self.api(self.seller).put(f'/api/v1/clients/{self.other_client.id}', {'firstname': 'X'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+    def test_details_scoped(self):
+        seller, manager = self.api(self.seller), self.api(self.manager)
+        for url in (f'/api/v1/clients/{self.other_client.id}', f'/api/v1/contracts/{self.other_contract.id}'):
+            with self.subTest(url=url):
+                self.assertEqual(seller.get(url).status_code, 404)
+                self.assertEqual(manager.get(url).status_code, 200)
+        self.assertEqual(seller.get(f'/api/v1/clients/{self.clients[0].id}').status_code, 200)
+        self.assertEqual(self.api(self.support).get(f'/api/v1/clients/{self.clients[0].id}').status_code, 404)
+        self.assertEqual(self.api(self.support).get(f'/api/v1/clients/{self.clients[1].id}').status_code, 200)
+
+class EventCreateTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contract = Contract.objects.create(client=self.clients[0], amount=10, status='signed', sales_contact=self.seller)
+        self.data = {'contract_id': self.contract.id, 'client_mail': self.clients[0].email,
+                     'attendees': 5, 'event_date': '2022-05-01', 'notes': 'Notes'}
+
+    def test_one_event_per_contract(self):
+        client = self.api(self.seller)
+        response = client.post('/api/v1/events/', self.data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLessEqual(int(response['X-Query-Count']), int(response['X-Query-Budget']))
+        response = client.post('/api/v1/events/', self.data, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Event.objects.filter(contract=self.contract).count(), 1)
+
+    def test_checks(self):
+        client = self.api(self.seller)
+        for data in ({**self.data, 'client_mail': self.clients[1].email},
+                     {**self.data, 'contract_id': self.contracts[0].id, 'client_mail': self.clients[0].email},
+                     {**self.data, 'contract_id': 'x'}):
+            with self.subTest(data=data):
+                self.assertEqual(client.post('/api/v1/events/', data, format='json').status_code, 404)
+        self.assertFalse(Event.objects.filter(contract=self.contract).exists())
+
+
+    def integrity_error(self, **fields):
+        try:
+            with transaction.atomic():
+                Event.objects.create(**{'client': self.clients[1], 'contract': self.contracts[1], 'attendees': 1,
+                                        'event_date': datetime.date(2022, 5, 1), 'notes': '', **fields})
+        except IntegrityError as e:
+            return e
+        self.fail('No IntegrityError')
+
+    def test_only_the_constraint_conflicts(self):
+        self.assertTrue(views.violates(self.integrity_error(), Event, 'event_unique_contract'))
+        self.assertFalse(views.violates(self.integrity_error(contract=self.contract, attendees=None),
+                                        Event, 'event_unique_contract'))
+
+class BatchUpdateTest(APITestCase):
+
+    def test_results_per_change(self):
+        other = User.objects.create_user('other', 'seller', 'pw')
+        foreign = Contract.objects.create(client=self.clients[0], amount=10, sales_contact=other)
+        changes = [
+            {'id': self.contracts[0].id, 'status': 'signed'},
+            {'id': self.contracts[1].id, 'payment_due': '2023-06-30'},
+            {'id': foreign.id, 'status': 'signed'},
+            {'id': self.contracts[2].id, 'status': 'unknown'},
+            {'id': self.contracts[3].id, 'amount': 5},
+            {'id': self.contracts[0].id, 'status': 'ended'},
+        ]
+        response = self.api(self.seller).post('/api/v1/contracts/batch/', {'contracts': changes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual([result['result'] for result in response.data['results']],
+                         ['updated', 'updated', 'not_found', 'invalid', 'invalid', 'invalid'])
+        self.assertEqual(Contract.objects.get(id=self.contracts[0].id).status, 'signed')
+        self.assertEqual(Contract.objects.get(id=self.contracts[1].id).payment_due, datetime.date(2023, 6, 30))
+        self.assertEqual(Contract.objects.get(id=foreign.id).status, 'unsigned')
+
+    def test_manager_and_summary(self):
+        response = self.api(self.manager).post('/api/v1/contracts/batch/', {'contracts': [
+            {'id': self.contracts[0].id, 'status': 'ended', 'payment_due': '2023-01-15'}]}, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertSummaryMatches()
+
+    def test_invalid_batch(self):
+        client = self.api(self.seller)
+        self.assertEqual(client.post('/api/v1/contracts/batch/', {'contracts': []}, format='json').status_code, 400)
+        self.assertEqual(self.api(self.support).post('/api/v1/contracts/batch/', {'contracts': [
+            {'id': self.contracts[0].id, 'status': 'signed'}]}, format='json').status_code, 403)
+
+
+class SparseFieldsTest(APITestCase):
+
+    def test_fields(self):
+        client = self.api(self.seller)
+        full = client.get('/api/v1/events/').data['results']
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/v1/events/?fields=id,client,event_date')
+        self.assertEqual(response.data['results'],
+                         [{name: row[name] for name in ('id', 'client', 'event_date')} for row in full])
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"api_event"."event_date"', sql)
+        self.assertNotIn('"api_event"."notes"', sql)
+        self.assertNotIn('api_user', sql)
+
+    def test_unknown_field(self):
+        response = self.api(self.seller).get('/api/v1/clients/?fields=id,password')
+        self.assertEqual(response.status_code, 404)
+
+
+class FastListRenderingTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        client = Client.objects.create(firstname='Émile', lastname='Line\u2028Break', email='emile@example.com',
+                                       mobile='0711111111', company_name='"Quoted" & <tagged>', sale_contact=cls.seller)
+        Contract.objects.create(client=client, amount=0.00001, sales_contact=cls.seller, payment_due=None)
+        Contract.objects.create(client=client, amount=1e17, status='signed', sales_contact=cls.seller)
+
+    def get(self, client, url, fast):
+        for cache in caches.all():
+            cache.clear()
+        with override_settings(FAST_LIST_RENDERING=fast):
+            return client.get(url)
+
+    def test_same_bytes(self):
+        client = self.api(self.seller)
+        for url in ('/api/v1/clients/', '/api/v1/contracts/', '/api/v1/events/', '/api/v1/events/?fields=id,contract',
+                    '/api/v1/contracts/?ordering=-amount&page_size=2', '/api/v1/clients/?search=emile'):
+            with self.subTest(url=url):
+                slow, fast = self.get(client, url, False), self.get(client, url, True)
+                self.assertEqual(slow.status_code, 200)
+                self.assertEqual(fast.content, slow.content)
+                self.assertEqual(fast['ETag'], slow['ETag'])
+
+    def test_render_json(self):
+        for data in ({'text': 'é \u2028 \u2029 "\\ <>'}, {'results': [{'amount': 0.1}, {'amount': None}]},
+                     {'results': [{'amount': 1e20}, {'amount': 1e-7}]}):
+            with self.subTest(data=data):
+                results = data.get('results', ())
+                self.assertEqual(render_json(data, results, ['amount'] if results else ()), JSONRenderer().render(data))
+
+
+class ClientRollupsTest(APITestCase):
+
+    def rollups(self, client):
+        client.refresh_from_db()
+        return client.contract_count, client.signed_amount, client.next_event_date
+
+    def test_follow_contracts_and_events(self):
+        client, other = self.clients[0], self.clients[1]
+        self.assertEqual(self.rollups(client), (1, 0, None))
+        self.assertEqual(self.rollups(other), (1, 100, None))
+        contract = Contract.objects.create(client=client, amount=250, status='signed', sales_contact=self.seller)
+        self.assertEqual(self.rollups(client), (2, 250, None))
+        soon, later = timezone.localdate() + datetime.timedelta(days=3), timezone.localdate() + datetime.timedelta(days=9)
+        event = Event.objects.create(client=client, contract=contract, attendees=5, event_date=later,
+                                     support_contact=self.support)
+        self.assertEqual(self.rollups(client), (2, 250, later))
+        event.event_date = soon
+        event.save()
+        self.assertEqual(self.rollups(client), (2, 250, soon))
+        contract.client = other
+        contract.save()
+        self.assertEqual(self.rollups(client), (1, 0, soon))
+        self.assertEqual(self.rollups(other), (2, 350, None))
+        event.delete()
+        self.assertEqual(self.rollups(client), (1, 0, None))
+        contract.delete()
+        self.assertEqual(self.rollups(other), (1, 100, None))
+
+    def test_past_events_and_rebuild(self):
+        client = self.clients[0]
+        contract = Contract.objects.create(client=client, amount=10, status='signed', sales_contact=self.seller)
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        Event.objects.create(client=client, contract=contract, attendees=5, event_date=tomorrow,
+                             support_contact=self.support)
+        self.assertEqual(refresh_past_next_events(tomorrow), 0)
+        self.assertEqual(refresh_past_next_events(tomorrow + datetime.timedelta(days=1)), 1)
+        self.assertEqual(self.rollups(client), (2, 10, None))
+        Client.objects.update(contract_count=0, signed_amount=0)
+        self.assertEqual(rebuild_client_rollups(batch_size=4), Client.objects.count())
+        self.assertEqual(self.rollups(client), (2, 10, tomorrow))
+
+    def test_list_ordering_and_filters(self):
+        api = self.api(self.seller)
+        response = api.get('/api/v1/clients/?ordering=-signed_amount&page_size=2')
+        self.assertEqual(response.status_code, 200)
+        amounts = [row['signed_amount'] for row in response.data['results']]
+        self.assertEqual(amounts, [300, 100])
+        self.assertEqual(self.ids(api.get('/api/v1/clients/?signed_amount=300')), [self.clients[3].id])
+        Contract.objects.create(client=self.clients[2], amount=10, sales_contact=self.seller)
+        self.assertEqual(self.ids(api.get('/api/v1/clients/?contract_count=2')), [self.clients[2].id])
+        self.assertEqual(self.ids(api.get('/api/v1/clients/?ordering=next_event_date')), [])
+
+
+THROTTLED = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={'detail': '3/min', 'list': '2/hour', 'export': '1/hour'})
+
+
+@override_settings(REST_FRAMEWORK=THROTTLED)
+class ThrottleTest(APITestCase):
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('120/min'), (120, 60))
+        self.assertEqual(parse_rate('30/hour'), (30, 3600))
+
+    def test_bucket_per_user(self):
+        seller, manager = self.api(self.seller), self.api(self.manager)
+        url = f'/api/v1/clients/{self.clients[0].id}'
+        self.assertEqual([seller.get(url).status_code for _ in range(3)], [200] * 3)
+        response = seller.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(manager.get(url).status_code, 200)
+
+    def test_scopes(self):
+        api = self.api(self.seller)
+        self.assertEqual(api.get('/api/v1/clients/?export=csv').status_code, 200)
+        self.assertEqual(api.get('/api/v1/clients/?export=csv').status_code, 429)
+        self.assertEqual([api.get('/api/v1/contracts/').status_code for _ in range(3)], [200, 200, 429])
+        self.assertEqual(api.get(f'/api/v1/contracts/{self.contracts[0].id}').status_code, 200)
+
+
+class AdminTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'pw'))
+
+    def test_changelists(self):
+        for model in ('client', 'contract', 'event'):
+            url = f'/admin/api/{model}/'
+            with self.subTest(model=model), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            Contract.objects.create(client=self.clients[0], amount=1, sales_contact=self.seller)
+            with self.subTest(model=model), self.assertNumQueries(len(queries)):
+                self.client.get(url)
+
+    def test_contract_search(self):
+        contract = self.contracts[2]
+        response = self.client.get('/admin/api/contract/', {'q': str(contract.id)})
+        self.assertEqual(list(response.context['cl'].result_list), [contract])
+        response = self.client.get('/admin/api/contract/', {'q': 'client2@example.com'})
+        self.assertEqual(list(response.context['cl'].result_list), [contract])
+
+    def test_client_search(self):
+        response = self.client.get('/admin/api/client/', {'q': 'first4'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.clients[4]])
+        response = self.client.get('/admin/api/client/', {'q': '--'})
+        self.assertEqual(response.context['cl'].result_count, len(self.clients))
+
+    def test_client_search_ranked(self):
+        strong = Client.objects.create(firstname='Alpha', lastname='Alpha', email='alpha@example.com',
+                                       mobile='0700000002', company_name='Alpha', sale_contact=self.seller)
+        weak = Client.objects.create(firstname='Bob', lastname='Stone', email='bob@example.com', mobile='0700000001',
+                                     company_name='Alpha', sale_contact=self.seller)
+        response = self.client.get('/admin/api/client/', {'q': 'alpha'})
+        self.assertEqual(list(response.context['cl'].result_list), [strong, weak])
+        # Sorted by the firstname column instead.
+        response = self.client.get('/admin/api/client/', {'q': 'alpha', 'o': '-1'})
+        self.assertEqual(list(response.context['cl'].result_list), [weak, strong])
+
+    def test_change_pages(self):
+        for url in (f'/admin/api/client/{self.clients[1].id}/change/', f'/admin/api/contract/{self.contracts[1].id}/change/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class CalendarTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        today = timezone.localdate()
+        cls.upcoming = []
+        for days, client in ((2, cls.clients[0]), (2, cls.clients[1]), (5, cls.clients[2]), (40, cls.clients[3])):
+            contract = Contract.objects.create(client=client, amount=1, status='signed', sales_contact=cls.seller)
+            cls.upcoming.append(Event.objects.create(
+                client=client, contract=contract, attendees=days, event_date=today + datetime.timedelta(days=days),
+                notes='Line one\nline; two', support_contact=cls.support))
+
+    def test_calendar(self):
+        response = self.api(self.support).get('/api/v1/events/calendar/')
+        self.assertEqual(response.status_code, 200)
+        days = [(str(day['date']), [event['id'] for event in day['events']]) for day in response.data['days']]
+        first, second, third, _ = self.upcoming
+        self.assertEqual(days, [(str(first.event_date), [first.id, second.id]), (str(third.event_date), [third.id])])
+        self.assertIn('/api/v1/events/calendar.ics?token=', response.data['feed'])
+
+    def test_calendar_window(self):
+        api = self.api(self.support)
+        start = timezone.localdate() + datetime.timedelta(days=3)
+        response = api.get(f'/api/v1/events/calendar/?start={start}&end={start + datetime.timedelta(days=40)}')
+        self.assertEqual([day['events'][0]['id'] for day in response.data['days']], [self.upcoming[2].id, self.upcoming[3].id])
+        self.assertEqual(api.get(f'/api/v1/events/calendar/?start={start}&end={start}').status_code, 404)
+        self.assertEqual(api.get('/api/v1/events/calendar/?start=tomorrow').status_code, 404)
+        self.assertEqual(self.api(self.seller).get('/api/v1/events/calendar/').status_code, 403)
+
+    def test_feed(self):
+        feed = self.api(self.support).get('/api/v1/events/calendar/').data['feed']
+        response = self.client.get(feed)
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 4)
+        self.assertIn(f'UID:event-{self.upcoming[0].id}@epicevents', content)
+        self.assertIn('DESCRIPTION:Line one\\nline\\; two', content)
+        self.assertEqual(self.client.get(feed, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        event = self.upcoming[3]
+        event.notes = 'Moved'
+        event.save()
+        response = self.client.get(feed, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('DESCRIPTION:Moved', response.content.decode())
+
+    def test_feed_token(self):
+        self.assertEqual(self.client.get('/api/v1/events/calendar.ics?token=forged').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/events/calendar.ics').status_code, 404)
+        # A token of the first version, holding only the user id.
+        token = signing.dumps(self.support.pk, salt='api.calendar.feed')
+        self.assertEqual(self.client.get(f'/api/v1/events/calendar.ics?token={token}').status_code, 404)
+
+    def test_revoked_feed(self):
+        api = self.api(self.support)
+        response = api.get('/api/v1/events/calendar/')
+        feed = response.data['feed']
+        renewed = api.post('/api/v1/events/calendar/feed/')
+        self.assertEqual(renewed.status_code, 201)
+        self.assertLessEqual(int(renewed['X-Query-Count']), int(renewed['X-Query-Budget']))
+        self.assertEqual(self.client.get(feed).status_code, 404)
+        self.assertEqual(self.client.get(renewed.data['feed']).status_code, 200)
+        # The calendar shows the new URL, even to a client holding the previous copy.
+        response = api.get('/api/v1/events/calendar/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.data['feed']), (200, renewed.data['feed']))
+        self.assertEqual(self.api(self.seller).post('/api/v1/events/calendar/feed/').status_code, 403)
+
+    def test_inactive_user_feed(self):
+        feed = self.api(self.support).get('/api/v1/events/calendar/').data['feed']
+        self.support.is_active = False
+        self.support.save()
+        self.assertEqual(self.client.get(feed).status_code, 404)
+
+
+@mock.patch('api.sync.SYNC_LAG_SECONDS', 0)
+class SyncTest(APITestCase):
+
+    def poll(self, api, url):
+        response = api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def row_ids(self, page):
+        return [row['id'] for row in page['results']]
+
+    def test_round_trip(self):
+        api = self.api(self.seller)
+        page = self.poll(api, '/api/v1/contracts/sync/?page_size=4')
+        self.assertTrue(page['more'])
+        self.assertEqual(self.row_ids(page), [contract.id for contract in self.contracts[:4]])
+        page = self.poll(api, page['next'])
+        self.assertFalse(page['more'])
+        self.assertEqual(self.row_ids(page), [contract.id for contract in self.contracts[4:]])
+        self.assertEqual(self.poll(api, page['next'])['results'], [])
+
+        changed, deleted = self.contracts[2], self.contracts[0]
+        changed.amount = 999
+        changed.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        page = self.poll(api, page['next'])
+        self.assertEqual((self.row_ids(page), page['deleted']), ([changed.id], [deleted_id]))
+        page = self.poll(api, page['next'])
+        self.assertEqual((page['results'], page['deleted']), ([], []))
+
+    def test_cascade_and_fields(self):
+        api = self.api(self.seller)
+        page = self.poll(api, '/api/v1/events/sync/?fields=id,event_date')
+        self.assertEqual([set(row) for row in page['results']], [{'id', 'event_date'}] * len(self.events))
+        self.contracts[1].delete()
+        self.assertEqual(self.poll(api, page['next'])['deleted'], [self.events[0].id])
+
+    def test_watermarks(self):
+        api = self.api(self.seller)
+        expired = Watermark(deleted=(timezone.now() - datetime.timedelta(days=31), 0)).encode()
+        self.assertEqual(api.get(f'/api/v1/clients/sync/?updated_since={expired}').status_code, 410)
+        self.assertEqual(self.api(self.support).get('/api/v1/clients/sync/').status_code, 403)
+
+    def test_malformed_watermarks(self):
+        api = self.api(self.seller)
+        stamp = timezone.now().isoformat()
+        for value in ([], [None, []], [None, [stamp[:19], 1]], [None, [stamp, True]], [[stamp], [stamp, 1]], {}):
+            token = urlsafe_b64encode(json.dumps(value).encode()).decode()
+            with self.subTest(value=value):
+                self.assertEqual(api.get(f'/api/v1/clients/sync/?updated_since={token}').status_code, 400)
+        self.assertEqual(api.get('/api/v1/clients/sync/?updated_since=invalid').status_code, 400)
+        self.assertEqual(api.get('/api/v1/clients/sync/?fields=unknown').status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTest(SimpleTestCase):
+    """Routing decisions only, the test database has no replica connection."""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, routing):
+        token = current_routing.set(routing)
+        try:
+            return self.router.db_for_read(Client)
+        finally:
+            current_routing.reset(token)
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Client), 'default')
+        self.assertEqual(self.route(Routing(primary=False)), 'replica1')
+        self.assertEqual(self.route(Routing(primary=True)), 'default')
+        routing = Routing(primary=False)
+        token = current_routing.set(routing)
+        try:
+            self.assertEqual(self.router.db_for_write(Client), 'default')
+        finally:
+            current_routing.reset(token)
+        self.assertTrue(routing.wrote)
+        self.assertEqual(self.route(routing), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'api'))
+        self.assertIsNone(self.router.allow_migrate('default', 'api'))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.route(Routing(primary=False)), 'default')
+
+    def request(self, method, authorization='Bearer a', write=False):
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Client))
+            if write:
+                self.router.db_for_write(Client)
+            return HttpResponse()
+        request = getattr(self.factory, method)('/api/v1/clients/', HTTP_AUTHORIZATION=authorization)
+        ReplicaRoutingMiddleware(view)(request)
+        return reads[0]
+
+    def test_primary_pins(self):
+        self.assertEqual(self.request('get'), 'replica1')
+        self.assertEqual(self.request('post', write=True), 'default')
+        self.assertEqual(self.request('get'), 'default')
+        self.assertEqual(self.request('get', authorization='Bearer b'), 'replica1')
+        self.assertEqual(self.request('head', authorization='Bearer b'), 'replica1')
+        self.assertEqual(self.request('post', authorization='Bearer c'), 'default')
+        self.assertEqual(self.request('get', authorization='Bearer c'), 'replica1')
+
+    def test_login_session(self):
+        request = self.factory.post('/admin/login/')
+        response = HttpResponse()
+        response.set_cookie(settings.SESSION_COOKIE_NAME, 'new-session')
+        primary_pins.pin(request, response)
+        request = self.factory.get('/admin/', HTTP_COOKIE=f'{settings.SESSION_COOKIE_NAME}=new-session')
+        self.assertTrue(primary_pins.pinned(request))
+        self.assertFalse(primary_pins.pinned(self.factory.get('/admin/')))
@@ -0,0 +1,82 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (120, 60): a bucket of 120 requests, refilled in 60 seconds."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per user (per IP address when anonymous) and scope.
+
+    'throttle_scopes' of a view maps an HTTP method to a scope, a list GET
+    with '?export=' takes the 'export' scope. The rate of a scope is set in
+    REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], e.g. '120/min' lets a user
+    send 120 requests at once, then one every half second; a view or a scope
+    without rate isn't throttled.
+
+    The bucket is kept in the THROTTLE_CACHE_ALIAS cache, shared by the
+    server processes, as the time it is full again (GCRA): cache.incr()
+    moves it atomically, so concurrent requests of one user can't both
+    take the last token.
+    """
+    cache_format = 'api:throttle:{scope}:{ident}'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scopes', {}).get(request.method)
+        if scope == 'list' and request.query_params.get(getattr(view, 'export_param', 'export')):
+            return 'export'
+        return scope
+
+    def get_cache_key(self, request, scope):
+        ident = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        return self.cache_format.format(scope=scope, ident=ident)
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        interval = period * 1000 // capacity
+        now = int(time.time() * 1000)
+        key = self.get_cache_key(request, scope)
+
+        # The bucket is full again at 'full_at' (ms), each request moves it by one interval.
+        try:
+            full_at = self.cache.incr(key, interval)
+        except ValueError:
+            full_at = None
+        if full_at is None or full_at - interval < now:
+            # Missing or full bucket: it restarts from now.
+            full_at = now + interval
+            self.cache.set(key, full_at, timeout=period)
+            return True
+
+        allowed_at = full_at - capacity * interval
+        if now < allowed_at:
+            self.cache.decr(key, interval)
+            self.retry_after = (allowed_at - now) / 1000
+            return False
+        self.cache.touch(key, timeout=math.ceil((full_at - now) / 1000) + 1)
+        return True
+
+    def wait(self):
+        return self.retry_after
@@ -1,20 +1,36 @@
 from . import views
+from . import async_views
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
 
 urlpatterns = [
-    path('signin/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('signin/', views.SignIn.as_view(), name='token_obtain_pair'),
+    path('token/refresh/', views.TokenRefresh.as_view(), name='token_refresh'),
     path('clients/', views.ClientList.as_view()),
     path('clients/<int:pk>', views.ClientDetail.as_view()),
+    path('clients/import/', views.ClientImport.as_view()),
+    path('clients/sync/', views.ClientSync.as_view()),
     path('contracts/', views.ContractList.as_view()),
     path('contracts/<int:pk>', views.ContractDetail.as_view()),
+    path('contracts/import/', views.ContractImport.as_view()),
+    path('contracts/sync/', views.ContractSync.as_view()),
+    path('contracts/batch/', views.ContractBatchUpdate.as_view()),
     path('events/', views.EventList.as_view()),
     path('events/<int:pk>', views.EventDetail.as_view()),
+    path('events/import/', views.EventImport.as_view()),
+    path('events/sync/', views.EventSync.as_view()),
+    # Before 'events/calendar/', whose format suffix pattern also matches 'events/calendar.ics'.
+    path('events/calendar.ics', views.calendar_feed, name='calendar_feed'),
+    path('events/calendar/', views.EventCalendar.as_view()),
+    path('events/calendar/feed/', views.CalendarFeed.as_view()),
+    path('reports/sales/', views.SalesReport.as_view()),
+    path('metrics/', views.metrics),
+    path('async/clients/', async_views.client_list),
+    path('async/clients/<int:pk>', async_views.client_detail),
+    path('async/contracts/', async_views.contract_list),
+    path('async/contracts/<int:pk>', async_views.contract_detail),
+    path('async/events/', async_views.event_list),
+    path('async/events/<int:pk>', async_views.event_detail),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -1,22 +1,72 @@
+import datetime
+import hashlib
+import hmac
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.core import signing
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.utils.http import quote_etag
 from rest_framework import generics
 from rest_framework import mixins
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-
-from .models import Client, User, Contract, Event
-from .serializers import ClientSerializer, ContractSerializer, EventSerializer
-from .permissions import IsSeller, IsSellerResponsibleOfClient, IsSellerResponsibleOfContract, IsSupport
-from .utils import filter_date, is_responsibleOfObject
-
-
-class ClientList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.GenericAPIView):
-    queryset = Client.objects.all()
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from .models import Client, User, Contract, Event, SalesSummary
+from .serializers import ClientSerializer, ClientImportSerializer, ContractSerializer, ContractBatchSerializer, EventSerializer, TokenSerializer, TokenRefreshClaimsSerializer
+from .permissions import IsManager, IsSeller, IsSellerOrManager, IsSellerResponsibleOfClient, IsSellerResponsibleOfContract, IsSupport
+from .filters import ClientFilter, ContractFilter, EventFilter, parse_date, parse_month
+from .calendar import FEED_WINDOW_DAYS, calendar, feed_key, feed_token, vevent_cache
+from .cache import response_cache
+from .metrics import registry
+from .mixins import QueryBudgetMixin, StreamingExportMixin, ConditionalGetMixin, CachedListMixin, SparseFieldsMixin, FastListMixin
+from .pagination import KeysetPagination
+from .parsers import NDJSONParser, CSVParser
+from .reports import count_contracts, move_contracts, sales_report, summary_of
+from .rollups import refresh_client_rollups
+from .sync import Watermark, advance, read_changes, read_deletions, sync_horizon
+
+
+def violates(error, model, constraint_name):
+    """True when the IntegrityError 'error' comes from the unique constraint 'constraint_name' of 'model'."""
+    diag = getattr(error.__cause__, 'diag', None)
+    if diag is not None:
+        # psycopg2 names the constraint.
+        return diag.constraint_name == constraint_name
+    constraint = next(constraint for constraint in model._meta.constraints if constraint.name == constraint_name)
+    columns = ', '.join(f'{model._meta.db_table}.{model._meta.get_field(name).column}' for name in constraint.fields)
+    return f'UNIQUE constraint failed: {columns}' in str(error)
+
+
+class SignIn(TokenObtainPairView):
+    serializer_class = TokenSerializer
+    throttle_scopes = {'POST': 'signin'}
+
+
+class TokenRefresh(TokenRefreshView):
+    serializer_class = TokenRefreshClaimsSerializer
+
+
+class ClientList(QueryBudgetMixin, CachedListMixin, StreamingExportMixin, ConditionalGetMixin, SparseFieldsMixin, FastListMixin, mixins.ListModelMixin, mixins.CreateModelMixin, generics.GenericAPIView):
+    queryset = Client.objects.select_related('sale_contact')
     serializer_class  = ClientSerializer
     permission_classes = [IsAuthenticated, IsSeller]
+    throttle_scopes = {'GET': 'list', 'POST': 'write'}
+    query_budget = {'GET': 1, 'POST': 3}
+    pagination_class = KeysetPagination
+    filter_class = ClientFilter
+    cache_dependencies = ('client', 'contract', 'event', 'user')
 
     def get(self, request, *args, **kwargs):
-        return self.list(request, *args, **kwargs)
+        return self.cached_list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         self.check_object_permissions(request, None)
@@ -24,19 +74,26 @@ class ClientList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.Generi
 
     def list(self, request, *args, **kwargs):
         clients = self.get_queryset()
-        lastname, email = request.query_params.get('lastname'), request.query_params.get('email')
-        responsible = request.query_params.get('responsible')
-        
+        filters = self.filter_class(request.query_params)
+
         try:
-            clients = is_responsibleOfObject(responsible, request.user, clients)
+            clients = filters.filter_queryset(clients, request.user)
+            self.keyset_ordering = filters.ordering
+            self.sparse_fields = self.get_sparse_fields(request)
+            export_format = self.get_export_format(request)
         except ValueError as e:
             return Response({'detail': e.args}, status=status.HTTP_404_NOT_FOUND)
 
-        if lastname: clients = clients.filter(lastname=lastname)
-        if email: clients = clients.filter(email=email)
+        clients = self.prune_queryset(clients, self.keyset_ordering)
 
-        serializer = self.serializer_class(clients, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if export_format:
+            return self.export(clients.order_by(*self.keyset_ordering), export_format)
+
+        if self.fast_list_enabled(request):
+            return self.fast_page(request, clients)
+
+        page = self.paginate_queryset(clients)
+        return self.conditional_page(request, page)
 
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data)
@@ -46,24 +103,25 @@ class ClientList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.Generi
         return Response(serializer.data, status=status.HTTP_201_CREATED)
         
 
-class ClientDetail(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.GenericAPIView):
-    queryset = Client.objects.all()
+class ClientDetail(QueryBudgetMixin, ConditionalGetMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.GenericAPIView):
+    queryset = Client.objects.select_related('sale_contact')
     serializer_class  = ClientSerializer
     permission_classes = [IsAuthenticated, IsSeller, IsSellerResponsibleOfClient]
+    throttle_scopes = {'GET': 'detail', 'PUT': 'write'}
+    query_budget = {'GET': 1, 'PUT': 1}
 
     def get(self, request, *args, **kwargs):
         try:
-            client = Client.objects.get(id=self.kwargs['pk'])
+            client = self.get_queryset().visible_to(request.user).get(id=self.kwargs['pk'])
         except Client.DoesNotExist:
             return Response({"detail": "This ID client doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = self.serializer_class(client)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.conditional_get(
+            request, [client], lambda: Response(self.serializer_class(client).data, status=status.HTTP_200_OK))
 
     def put(self, request, *args, **kwargs):
         try:
-            client = Client.objects.get(id=self.kwargs['pk'])
-            
+            client = self.get_queryset().with_visibility(request.user).get(id=self.kwargs['pk'])
         except Client.DoesNotExist:
             return Response({"detail": "This ID client doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -73,36 +131,44 @@ class ClientDetail(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.De
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class ContractList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.GenericAPIView):
-    queryset = Contract.objects.all()
+class ContractList(QueryBudgetMixin, CachedListMixin, StreamingExportMixin, ConditionalGetMixin, SparseFieldsMixin, FastListMixin, mixins.ListModelMixin, mixins.CreateModelMixin, generics.GenericAPIView):
+    queryset = Contract.objects.select_related('client', 'sales_contact')
     serializer_class  = ContractSerializer
     permission_classes = [IsAuthenticated, IsSeller]
+    throttle_scopes = {'GET': 'list', 'POST': 'write'}
+    query_budget = {'GET': 1, 'POST': 6}
+    pagination_class = KeysetPagination
+    filter_class = ContractFilter
+    cache_dependencies = ('contract', 'client', 'user')
 
     def get(self, request, *args, **kwargs):
-        return self.list(request, *args, **kwargs)
+        return self.cached_list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
     def list(self, request, *args, **kwargs):
         contracts = self.get_queryset()
-        lastname, email = request.query_params.get('lastname'), request.query_params.get('email')
-        date_created, amount = request.query_params.get('date_created'), request.query_params.get('amount')
-        responsible = request.query_params.get('responsible')
-        
-        
+        filters = self.filter_class(request.query_params)
+
         try:
-            contracts = is_responsibleOfObject(responsible, request.user, contracts)
-            contracts = filter_date(date_created, contracts, 'date_created')
-            if lastname: contracts = contracts.filter(client__lastname=lastname)
-            if email: contracts = contracts.filter(client__email=email)
+            contracts = filters.filter_queryset(contracts, request.user)
+            self.keyset_ordering = filters.ordering
+            self.sparse_fields = self.get_sparse_fields(request)
+            export_format = self.get_export_format(request)
         except ValueError as e:
             return Response({'detail': e.args}, status=status.HTTP_404_NOT_FOUND)
-        if amount: contracts = contracts.filter(amount=amount)
 
+        contracts = self.prune_queryset(contracts, self.keyset_ordering)
 
-        serializer = self.serializer_class(contracts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if export_format:
+            return self.export(contracts.order_by(*self.keyset_ordering), export_format)
+
+        if self.fast_list_enabled(request):
+            return self.fast_page(request, contracts)
+
+        page = self.paginate_queryset(contracts)
+        return self.conditional_page(request, page)
 
     def create(self, request, *args, **kwargs):
         self.check_object_permissions(request, None)
@@ -113,30 +179,32 @@ class ContractList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.Gene
             return Response({'detail': "This client doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
         if client.role == 'prospect':
             return Response({'detail': "Can't create a contract for a prospect."}, status=status.HTTP_404_NOT_FOUND)
-        if client.sale_contact != request.user:
+        if client.sale_contact_id != request.user.id:
             return Response({'detail': "You're not responsible of this client."}, status=status.HTTP_404_NOT_FOUND)
         serializer.is_valid(raise_exception=True)
         serializer.save(sales_contact=request.user, client=client, status='unsigned')
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class ContractDetail(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.GenericAPIView):
-    queryset = Contract.objects.all()
+class ContractDetail(QueryBudgetMixin, ConditionalGetMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.GenericAPIView):
+    queryset = Contract.objects.select_related('client', 'sales_contact')
     serializer_class  = ContractSerializer
     permission_classes = [IsAuthenticated, IsSeller, IsSellerResponsibleOfContract]
+    throttle_scopes = {'GET': 'detail', 'PUT': 'write'}
+    query_budget = {'GET': 1, 'PUT': 8}
 
     def get(self, request, *args, **kwargs):
         try:
-            contract = Contract.objects.get(id=self.kwargs['pk'])
+            contract = self.get_queryset().visible_to(request.user).get(id=self.kwargs['pk'])
         except Contract.DoesNotExist:
             return Response({"detail": "This ID contract doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = self.serializer_class(contract)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.conditional_get(
+            request, [contract], lambda: Response(self.serializer_class(contract).data, status=status.HTTP_200_OK))
 
     def put(self, request, *args, **kwargs):
         try:
-            contract = Contract.objects.get(id=self.kwargs['pk'])
+            contract = self.get_queryset().with_visibility(request.user).get(id=self.kwargs['pk'])
         except Contract.DoesNotExist:
             return Response({"detail": "This ID contract doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -154,88 +222,167 @@ class ContractDetail(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class EventList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.GenericAPIView):
-    queryset = Event.objects.all()
+class ContractBatchUpdate(generics.GenericAPIView):
+    """
+    Change the 'status' and/or 'payment_due' of many contracts:
+    {"contracts": [{"id": 1, "status": "signed"}, {"id": 2, "payment_due": "2022-06-30"}]}.
+
+    The contracts are read in one query scoped to the user (a seller only
+    changes their own contracts, a manager any contract), locked, and
+    written with bulk_update in one transaction. The response has a result
+    per change, in the request order: 'updated', 'invalid' or 'not_found'.
+    """
+    permission_classes = [IsAuthenticated, IsSellerOrManager]
+    throttle_scopes = {'POST': 'bulk'}
+    serializer_class = ContractBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        self.check_object_permissions(request, None)
+        changes = request.data.get('contracts') if isinstance(request.data, dict) else None
+        max_size = getattr(settings, 'BATCH_UPDATE_MAX_SIZE', 1000)
+        if not isinstance(changes, list) or not changes or len(changes) > max_size:
+            return Response({'detail': f"'contracts' must be a list of 1 to {max_size} changes."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results, valid = [None] * len(changes), {}
+        for index, change in enumerate(changes):
+            serializer = self.serializer_class(data=change)
+            if not serializer.is_valid():
+                results[index] = {'id': change.get('id') if isinstance(change, dict) else None,
+                                  'result': 'invalid', 'errors': serializer.errors}
+            elif serializer.validated_data['id'] in valid:
+                results[index] = {'id': serializer.validated_data['id'], 'result': 'invalid',
+                                  'errors': {'id': ['This contract is changed twice.']}}
+            else:
+                valid[serializer.validated_data['id']] = (index, serializer.validated_data)
+
+        with transaction.atomic():
+            contracts = Contract.objects.visible_to(request.user).select_for_update() \
+                .filter(id__in=valid).only('id', 'status', 'payment_due', 'amount', 'sales_contact_id', 'client_id')
+            contracts = {contract.id: contract for contract in contracts}
+            now, moves = timezone.now(), []
+            for id, (index, data) in valid.items():
+                contract = contracts.get(id)
+                if contract is None:
+                    results[index] = {'id': id, 'result': 'not_found'}
+                    continue
+                for field in ('status', 'payment_due'):
+                    if field in data:
+                        setattr(contract, field, data[field])
+                contract.date_updated = now
+                moves.append((contract._summary, summary_of(contract)))
+                results[index] = {'id': id, 'result': 'updated'}
+            Contract.objects.bulk_update(contracts.values(), ['status', 'payment_due', 'date_updated'],
+                                         batch_size=getattr(settings, 'IMPORT_BATCH_SIZE', 1000))
+            move_contracts(moves)
+            refresh_client_rollups(contract.client_id for contract in contracts.values())
+
+        if contracts:
+            response_cache.invalidate('contract')
+        return Response({'updated': len(contracts), 'results': results}, status=status.HTTP_200_OK)
+
+
+class EventList(QueryBudgetMixin, CachedListMixin, StreamingExportMixin, ConditionalGetMixin, SparseFieldsMixin, FastListMixin, mixins.ListModelMixin, mixins.CreateModelMixin, generics.GenericAPIView):
+    queryset = Event.objects.select_related('client', 'contract__client', 'support_contact')
     serializer_class  = EventSerializer
     permission_classes = [IsAuthenticated, IsSeller]
+    throttle_scopes = {'GET': 'list', 'POST': 'write'}
+    query_budget = {'GET': 1, 'POST': 4}
+    pagination_class = KeysetPagination
+    filter_class = EventFilter
+    cache_dependencies = ('event', 'contract', 'client', 'user')
 
     def get(self, request, *args, **kwargs):
-        return self.list(request, *args, **kwargs)
+        return self.cached_list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
     def list(self, request, *args, **kwargs):
         events = self.get_queryset()
-        lastname, email = request.query_params.get('lastname'), request.query_params.get('email')
-        event_date, responsible = request.query_params.get('event_date'), request.query_params.get('responsible')
+        filters = self.filter_class(request.query_params)
 
         try:
-            events = is_responsibleOfObject(responsible, request.user, events)
-            if lastname: events = events.filter(client__lastname=lastname)
-            if email: events = events.filter(client__email=email)
-            events = filter_date(event_date, events, 'event_date')
+            events = filters.filter_queryset(events, request.user)
+            self.keyset_ordering = filters.ordering
+            self.sparse_fields = self.get_sparse_fields(request)
+            export_format = self.get_export_format(request)
         except ValueError as e:
             return Response({'detail': e.args}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.serializer_class(events, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        events = self.prune_queryset(events, self.keyset_ordering)
+
+        if export_format:
+            return self.export(events.order_by(*self.keyset_ordering), export_format)
+
+        if self.fast_list_enabled(request):
+            return self.fast_page(request, events)
+
+        page = self.paginate_queryset(events)
+        return self.conditional_page(request, page)
 
     def create(self, request, *args, **kwargs):
         """
         Seul un 'seller' peut créer un évenement grâce à la permission 'IsSeller'.
-        On vérifie que le contrat n'a pas d'évémenent pour avoir un événement par contrat.
+        Le contrat, son client et le client de l'email sont lus en une requête,
+        la contrainte 'event_unique_contract' garantit un événement par contrat.
         """
         self.check_object_permissions(request, None)
         serializer = self.serializer_class(data=request.data)
         try:
-            client = Client.objects.get(email=request.data['client_mail'])
-            contracts_id = client.contracts.all().values_list('id', flat=True)
-
-            contract = Contract.objects.get(id=int(request.data['contract_id']))
-        except Client.DoesNotExist:
-            return Response({'detail': "This client doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
+            contract = Contract.objects.select_related('client').annotate(
+                mail_client_id=Subquery(Client.objects.filter(email=request.data.get('client_mail')).values('id')[:1]),
+            ).get(id=int(request.data['contract_id']))
         except Contract.DoesNotExist:
             return Response({'detail': "This contract doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
-        except ValueError:
+        except (KeyError, TypeError, ValueError):
             return Response({'detail': "Enter a correct contract ID."}, status=status.HTTP_404_NOT_FOUND)
 
-        if client.sale_contact != request.user:
+        client = contract.client
+        if contract.mail_client_id is None:
+            return Response({'detail': "This client doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
+        if contract.mail_client_id != client.id:
+            return Response({'detail': f"Client '{request.data['client_mail']}' don't have the contract ID {contract.id}."}, status=status.HTTP_404_NOT_FOUND)
+        if client.sale_contact_id != request.user.id:
             return Response({'detail': "You're not responsible on this client."}, status=status.HTTP_404_NOT_FOUND)
-        if contract.events.exists():
-            return Response({'detail': f"Contract '{contract.id}' already have an event."}, status=status.HTTP_404_NOT_FOUND)
-        if contract.id not in contracts_id:
-            return Response({'detail': f"Client '{client.email}' don't have the contract ID {contract.id}."}, status=status.HTTP_404_NOT_FOUND)
         if contract.status == 'unsigned':
-            return Response({'detail': f"Can't create an event on an 'unsigned' contract."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'detail': "Can't create an event on an 'unsigned' contract."}, status=status.HTTP_404_NOT_FOUND)
 
         serializer.is_valid(raise_exception=True)
-        serializer.save(client=client, contract=contract)
+        try:
+            with transaction.atomic():
+                serializer.save(client=client, contract=contract)
+        except IntegrityError as e:
+            if not violates(e, Event, 'event_unique_contract'):
+                raise
+            return Response({'detail': f"Contract '{contract.id}' already have an event."}, status=status.HTTP_409_CONFLICT)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class EventDetail(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.GenericAPIView):
-    queryset = Event.objects.all()
+class EventDetail(QueryBudgetMixin, ConditionalGetMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.GenericAPIView):
+    queryset = Event.objects.select_related('client', 'contract__client', 'support_contact')
     serializer_class  = EventSerializer
     permission_classes = [IsAuthenticated, IsSupport]
+    throttle_scopes = {'GET': 'detail', 'PUT': 'write'}
+    query_budget = {'GET': 1, 'PUT': 4}
 
     def get(self, request, *args, **kwargs):
         try:
-            event = Event.objects.get(id=self.kwargs['pk'])
+            event = self.get_queryset().visible_to(request.user).get(id=self.kwargs['pk'])
         except Event.DoesNotExist:
             return Response({"detail": "This ID event doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = self.serializer_class(event)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.conditional_get(
+            request, [event], lambda: Response(self.serializer_class(event).data, status=status.HTTP_200_OK))
 
     def put(self, request, *args, **kwargs):
         try:
-            event = Event.objects.get(id=self.kwargs['pk'])
+            event = self.get_queryset().with_visibility(request.user).get(id=self.kwargs['pk'])
         except Event.DoesNotExist:
             return Response({"detail": "This ID event doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
 
         self.check_object_permissions(request, event)
-        if event.support_contact != request.user:
+        if not event.is_visible:
             return Response({"detail": "You're not responsible on this event."}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = self.serializer_class(event, data=request.data, partial=True)
@@ -244,4 +391,382 @@ class EventDetail(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.Des
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class EventCalendar(QueryBudgetMixin, ConditionalGetMixin, SparseFieldsMixin, generics.GenericAPIView):
+    """
+    Events of the support user from 'start' (today by default) to 'end'
+    (excluded, 30 days later by default, at most 92), grouped by day and read
+    with a range scan of the (support_contact, event_date) index. 'fields'
+    narrows the events as on the lists. 'feed' is the URL of the iCal feed
+    of the user, read with its feed_version.
+    """
+    queryset = Event.objects.select_related('client', 'contract__client', 'support_contact')
+    serializer_class = EventSerializer
+    permission_classes = [IsAuthenticated, IsSupport]
+    throttle_scopes = {'GET': 'list'}
+    query_budget = {'GET': 2}
+    default_days = 30
+    max_days = 92
+
+    def get(self, request, *args, **kwargs):
+        self.check_object_permissions(request, None)
+        try:
+            start, end = self.get_window(request)
+            self.sparse_fields = self.get_sparse_fields(request)
+        except ValueError as e:
+            return Response({'detail': e.args}, status=status.HTTP_404_NOT_FOUND)
+
+        ordering = ('event_date', 'id')
+        events = list(self.prune_queryset(self.get_queryset(), ordering)
+                      .filter(support_contact=request.user, event_date__gte=start, event_date__lt=end)
+                      .order_by(*ordering))
+        # The claims don't hold the feed_version, a revoked feed URL changes the ETag.
+        user = User.objects.only('id', 'feed_version').get(id=request.user.id)
+
+        def render():
+            data = zip(events, self.get_serializer(events, many=True).data)
+            days = [{'date': day, 'events': [row for _, row in rows]}
+                    for day, rows in groupby(data, key=lambda pair: pair[0].event_date)]
+            return Response({'start': start, 'end': end, 'feed': feed_url(request, user), 'days': days},
+                            status=status.HTTP_200_OK)
+        return self.conditional_get(request, events, render, key=f'{request.get_full_path()}:{user.feed_version}',
+                                    use_last_modified=False)
+
+    def get_window(self, request):
+        start = request.query_params.get('start')
+        start = parse_date(start) if start else timezone.localdate()
+        end = request.query_params.get('end')
+        end = parse_date(end) if end else start + datetime.timedelta(days=self.default_days)
+        if not 0 < (end - start).days <= self.max_days:
+            raise ValueError(f"'end' must be 1 to {self.max_days} days after 'start'.")
+        return start, end
+
+
+class CalendarFeed(QueryBudgetMixin, generics.GenericAPIView):
+    """A new iCal feed URL for the support user, the previous ones stop working."""
+    permission_classes = [IsAuthenticated, IsSupport]
+    throttle_scopes = {'POST': 'write'}
+    query_budget = {'POST': 2}
+
+    def post(self, request, *args, **kwargs):
+        self.check_object_permissions(request, None)
+        users = User.objects.filter(id=request.user.id)
+        users.update(feed_version=F('feed_version') + 1)
+        return Response({'feed': feed_url(request, users.only('id', 'feed_version').get())},
+                        status=status.HTTP_201_CREATED)
+
+
+def feed_url(request, user):
+    return request.build_absolute_uri(f"{reverse('calendar_feed')}?token={feed_token(user)}")
+
+
+def calendar_feed(request):
+    """
+    iCal feed of the events of a support user, authenticated by the signed
+    'token' of its URL: the user must be active and the token hold their
+    current feed_version. Each request reads the versions of the events of
+    the window and only renders those changed since they were cached (see
+    VEventCache); an unchanged feed is a 304.
+    """
+    try:
+        user_id, feed_version = feed_key(request.GET.get('token', ''))
+        user = User.objects.get(id=user_id, feed_version=feed_version, role='support', is_active=True)
+    except (signing.BadSignature, User.DoesNotExist):
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+    today = timezone.localdate()
+    past_days, future_days = FEED_WINDOW_DAYS
+    versions = list(Event.objects.filter(
+        support_contact=user, event_date__gte=today - datetime.timedelta(days=past_days),
+        event_date__lte=today + datetime.timedelta(days=future_days),
+    ).order_by('event_date', 'id').values_list('id', 'date_updated', 'client__date_updated'))
+
+    etag = quote_etag(hashlib.sha1(repr((user.pk, today, versions)).encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        def load(ids):
+            return Event.objects.select_related('client').filter(id__in=ids)
+        content = calendar(f'Epic Events - {user.username}', vevent_cache.vevents(versions, load))
+        response = HttpResponse(content, content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="events.ics"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=300)
+    return response
+
+
+class SyncView(QueryBudgetMixin, SparseFieldsMixin, generics.GenericAPIView):
+    """
+    Rows created or changed since the 'updated_since' watermark and the ids
+    deleted since then (their tombstones), each read in (date, id) order with
+    a range scan of an index: a poll costs the changes, not the table.
+
+    Without 'updated_since' every row is read. 'more' is true while a
+    'page_size' limit cut the changes or the deletions, 'next' is the URL
+    of the next poll either way. 'fields' narrows the rows and only those
+    visible to the user are read, as on the lists.
+    """
+    permission_classes = [IsAuthenticated, IsSeller]
+    throttle_scopes = {'GET': 'list'}
+    query_budget = {'GET': 2}
+    pagination_class = KeysetPagination
+    watermark_param = 'updated_since'
+
+    def get(self, request, *args, **kwargs):
+        self.check_object_permissions(request, None)
+        horizon = sync_horizon()
+        try:
+            token = request.query_params.get(self.watermark_param)
+            watermark = Watermark.decode(token) if token else Watermark.start(horizon)
+            self.sparse_fields = self.get_sparse_fields(request)
+        except ValueError as e:
+            return Response({'detail': e.args}, status=status.HTTP_400_BAD_REQUEST)
+        if watermark.expired():
+            return Response({'detail': "This watermark expired, sync again without 'updated_since'."},
+                            status=status.HTTP_410_GONE)
+
+        size = self.paginator.get_page_size(request)
+        rows, more_rows = read_changes(
+            self.prune_queryset(self.get_queryset().visible_to(request.user), ('date_updated', 'id')),
+            watermark, size, horizon)
+        tombstones, more_tombstones = read_deletions(self.queryset.model._meta.model_name, watermark, size, horizon)
+
+        watermark = advance(watermark, rows, tombstones)
+        next_url = replace_query_param(request.build_absolute_uri(), self.watermark_param, watermark.encode())
+        return Response({
+            'next': next_url,
+            'more': more_rows or more_tombstones,
+            'results': self.get_serializer(rows, many=True).data,
+            'deleted': [object_id for _, _, object_id in tombstones],
+        }, status=status.HTTP_200_OK)
+
+
+class ClientSync(SyncView):
+    queryset = Client.objects.select_related('sale_contact')
+    serializer_class = ClientSerializer
+
+
+class ContractSync(SyncView):
+    queryset = Contract.objects.select_related('client', 'sales_contact')
+    serializer_class = ContractSerializer
+
+
+class EventSync(SyncView):
+    queryset = Event.objects.select_related('client', 'contract__client', 'support_contact')
+    serializer_class = EventSerializer
+
+
+class BulkImportView(generics.GenericAPIView):
+    """
+    Import NDJSON or CSV rows in batches of IMPORT_BATCH_SIZE.
+
+    Each batch is validated, its references are resolved with one query, and
+    its valid rows are written with bulk_create in their own transaction.
+    The response reports the created count and the errors by line: a 201
+    when every row was created, a 207 when some were, a 400 when none was.
+    """
+    permission_classes = [IsAuthenticated, IsSeller]
+    throttle_scopes = {'POST': 'bulk'}
+    parser_classes = [NDJSONParser, CSVParser]
+
+    def post(self, request, *args, **kwargs):
+        self.check_object_permissions(request, None)
+        rows = request.data if hasattr(request.data, '__next__') else iter([])
+        report = {'created': 0, 'errors': []}
+
+        batch_size = getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+        while batch := list(islice(rows, batch_size)):
+            instances = self.build_instances(self.validate(batch, report['errors']), report['errors'])
+            try:
+                with transaction.atomic():
+                    self.created(self.queryset.model.objects.bulk_create([instance for _, instance in instances]))
+            except IntegrityError as e:
+                report['errors'] += [{'line': line, 'errors': {'detail': str(e)}} for line, _ in instances]
+                continue
+            report['created'] += len(instances)
+            response_cache.invalidate(self.queryset.model._meta.model_name)
+
+        report['errors'].sort(key=lambda error: error['line'])
+        if not report['created']:
+            if not report['errors']:
+                report['detail'] = "There isn't any row to import."
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        if report['errors']:
+            return Response(report, status=status.HTTP_207_MULTI_STATUS)
+        return Response(report, status=status.HTTP_201_CREATED)
+
+    def validate(self, batch, errors):
+        valid = []
+        for line, row in batch:
+            if row is None:
+                errors.append({'line': line, 'errors': {'detail': "Can't parse this row."}})
+                continue
+            serializer = self.serializer_class(data=row)
+            if serializer.is_valid():
+                valid.append((line, row, serializer.validated_data))
+            else:
+                errors.append({'line': line, 'errors': serializer.errors})
+        return valid
+
+    def build_instances(self, valid, errors):
+        """
+        Hook of the subclasses: turn the (line, row, validated data) of a batch into the
+        (line, unsaved instance) to bulk_create, resolving their references with one query.
+        The rows failing these checks are appended to 'errors' as {'line', 'errors'} instead.
+        """
+        raise NotImplementedError(f"{type(self).__name__} must implement build_instances().")
+
+    def created(self, instances):
+        """Called in the batch transaction with the created instances, bulk_create sends no signal."""
+        pass
+
+
+class ClientImport(BulkImportView):
+    queryset = Client.objects.all()
+    serializer_class = ClientImportSerializer
+
+    def build_instances(self, valid, errors):
+        emails = {data['email'] for _, _, data in valid}
+        mobiles = {data['mobile'] for _, _, data in valid}
+        taken = set()
+        for email, mobile in Client.objects.filter(Q(email__in=emails) | Q(mobile__in=mobiles)).values_list('email', 'mobile'):
+            taken |= {('email', email), ('mobile', mobile)}
+
+        instances = []
+        for line, _, data in valid:
+            duplicates = {field: [f"A client with this {field} already exists."]
+                          for field in ('email', 'mobile') if (field, data[field]) in taken}
+            if duplicates:
+                errors.append({'line': line, 'errors': duplicates})
+                continue
+            taken |= {('email', data['email']), ('mobile', data['mobile'])}
+            instances.append((line, Client(**data, sale_contact=self.request.user)))
+        return instances
+
+
+class ContractImport(BulkImportView):
+    queryset = Contract.objects.all()
+    serializer_class = ContractSerializer
+
+    def build_instances(self, valid, errors):
+        emails = {row.get('client_email') for _, row, _ in valid}
+        clients = {client.email: client for client in
+                   Client.objects.filter(email__in=emails).only('id', 'email', 'role', 'sale_contact_id')}
+
+        instances = []
+        for line, row, data in valid:
+            client = clients.get(row.get('client_email'))
+            if client is None:
+                detail = "This client doesn't exist."
+            elif client.role == 'prospect':
+                detail = "Can't create a contract for a prospect."
+            elif client.sale_contact_id != self.request.user.id:
+                detail = "You're not responsible of this client."
+            else:
+                data = {key: value for key, value in data.items() if key != 'status'}
+                instances.append((line, Contract(**data, client=client, sales_contact=self.request.user, status='unsigned')))
+                continue
+            errors.append({'line': line, 'errors': {'detail': detail}})
+        return instances
+
+    def created(self, instances):
+        count_contracts(instances)
+        refresh_client_rollups(contract.client_id for contract in instances)
+
+
+class EventImport(BulkImportView):
+    queryset = Event.objects.all()
+    serializer_class = EventSerializer
+
+    def build_instances(self, valid, errors):
+        references = []
+        for line, row, data in valid:
+            try:
+                contract_id = int(row.get('contract_id'))
+            except (TypeError, ValueError):
+                errors.append({'line': line, 'errors': {'detail': "Enter a correct contract ID."}})
+                continue
+            references.append((line, row.get('client_email', row.get('client_mail')), contract_id, data))
+
+        clients = {client.email: client for client in
+                   Client.objects.filter(email__in={email for _, email, _, _ in references})
+                   .only('id', 'email', 'sale_contact_id')}
+        contracts = Contract.objects.filter(id__in={contract_id for _, _, contract_id, _ in references}) \
+            .annotate(has_event=Exists(Event.objects.filter(contract=OuterRef('pk')))) \
+            .only('id', 'status', 'client_id')
+        contracts = {contract.id: contract for contract in contracts}
+
+        instances = []
+        for line, email, contract_id, data in references:
+            client, contract = clients.get(email), contracts.get(contract_id)
+            if client is None:
+                detail = "This client doesn't exist."
+            elif client.sale_contact_id != self.request.user.id:
+                detail = "You're not responsible on this client."
+            elif contract is None:
+                detail = "This contract doesn't exist."
+            elif contract.has_event:
+                detail = f"Contract '{contract.id}' already have an event."
+            elif contract.client_id != client.id:
+                detail = f"Client '{client.email}' don't have the contract ID {contract.id}."
+            elif contract.status == 'unsigned':
+                detail = "Can't create an event on an 'unsigned' contract."
+            else:
+                contract.has_event = True
+                instances.append((line, Event(**data, client=client, contract=contract)))
+                continue
+            errors.append({'line': line, 'errors': {'detail': detail}})
+        return instances
+
+    def created(self, instances):
+        refresh_client_rollups(event.client_id for event in instances)
+
+
+class SalesReport(QueryBudgetMixin, generics.GenericAPIView):
+    """
+    Contracts count and amount grouped by 'seller', 'status' and/or 'month'
+    (of payment_due), e.g. ?group_by=seller,month&status=signed.
+    Read from the SalesSummary table, the contracts table is never scanned.
+    """
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_scopes = {'GET': 'list'}
+    query_budget = {'GET': 1}
+    group_by_choices = ('seller', 'status', 'month')
+
+    def get(self, request, *args, **kwargs):
+        self.check_object_permissions(request, None)
+        group_by = [name for name in request.query_params.get('group_by', 'seller').split(',') if name]
+        try:
+            for name in group_by:
+                if name not in self.group_by_choices:
+                    raise ValueError(f"Can't group by '{name}', choose in {', '.join(self.group_by_choices)}.")
+            summaries = self.filter_summaries(request.query_params)
+        except ValueError as e:
+            return Response({'detail': e.args}, status=status.HTTP_404_NOT_FOUND)
 
+        return Response({'group_by': group_by, 'results': sales_report(group_by, summaries)}, status=status.HTTP_200_OK)
+
+    def filter_summaries(self, query_params):
+        summaries = SalesSummary.objects.all()
+        if 'status' in query_params:
+            summaries = summaries.filter(status__in=query_params['status'].split(','))
+        if 'seller' in query_params:
+            summaries = summaries.filter(sales_contact__username__in=query_params['seller'].split(','))
+        if 'month__gte' in query_params:
+            summaries = summaries.filter(month__gte=parse_month(query_params['month__gte']))
+        if 'month__lte' in query_params:
+            summaries = summaries.filter(month__lte=parse_month(query_params['month__lte']))
+        return summaries
+
+
+def metrics(request):
+    """Metrics of this process in the Prometheus text format, for the scraper sending
+    'Authorization: Bearer <METRICS_TOKEN>' or a staff user signed in to the admin."""
+    if not (metrics_token_sent(request) or request.user.is_staff):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def metrics_token_sent(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
@@ -1,6 +1,7 @@
 import datetime
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 
@@ -40,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,12 +52,89 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# List endpoints are paginated with a cursor, 'page_size' is capped by MAX_PAGE_SIZE.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# JSON list pages rendered from values_list() rows without the serializers,
+# orjson writes them when it is installed (see api.mixins.FastListMixin).
+FAST_LIST_RENDERING = os.environ.get('FAST_LIST_RENDERING', '0') == '1'
+
+# Views declare a 'query_budget' per HTTP method, going over it is logged, and
+# raises when this is on: under 'manage.py test' unless QUERY_BUDGET_ENFORCE says otherwise.
+QUERY_BUDGET_ENFORCE = os.environ.get('QUERY_BUDGET_ENFORCE', '1' if sys.argv[1:2] == ['test'] else '0') == '1'
+
+# Bearer token of the Prometheus scraper reading /api/v1/metrics/, the staff users
+# signed in to the admin read them too. Nobody else does while it is empty.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Threads running the database part of the async (ASGI) views.
+ASYNC_DB_THREADS = 8
+
+# Rows validated and inserted together by the /import/ endpoints.
+IMPORT_BATCH_SIZE = 1000
+
+# Most contracts changed by one request to /contracts/batch/.
+BATCH_UPDATE_MAX_SIZE = 1000
+
+# The /sync/ endpoints leave the rows changed in the last SYNC_LAG_SECONDS to
+# the next poll, and keep the tombstones of deleted rows SYNC_TOMBSTONE_DAYS days.
+SYNC_LAG_SECONDS = 5
+SYNC_TOMBSTONE_DAYS = 30
+
+# Token buckets per user and scope (see api.throttling), 'list' and 'export'
+# are the expensive reads, 'bulk' the imports and batch updates.
 REST_FRAMEWORK = {
   'DEFAULT_AUTHENTICATION_CLASSES': (
-    'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'api.authentication.ClaimsJWTAuthentication',
   ),
+  'DEFAULT_THROTTLE_CLASSES': (
+    'api.throttling.TokenBucketThrottle',
+  ),
+  'DEFAULT_THROTTLE_RATES': {
+    'list': '120/min',
+    'export': '10/hour',
+    'detail': '600/min',
+    'write': '120/min',
+    'bulk': '30/hour',
+    'signin': '10/min',
+  },
+}
+
+# Cache holding the throttle buckets, shared by the server processes.
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Set CACHE_BACKEND / CACHE_LOCATION to a shared cache in production, e.g.
+# django.core.cache.backends.redis.RedisCache and redis://host:6379.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Changes of the users (see USER_CACHE_ALIAS), apart from the list pages
+    # and throttle buckets whose writes would evict them. Another backend
+    # than LocMemCache needs USER_CHANGES_CACHE_LOCATION.
+    'user_changes': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('USER_CHANGES_CACHE_LOCATION', 'user-changes'),
+        'KEY_PREFIX': 'user-changes',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
 
+# List pages are cached per user for LIST_CACHE_TIMEOUT seconds.
+LIST_CACHE_ALIAS = 'default'
+LIST_CACHE_TIMEOUT = 30
+
+# Users authenticated from their token claims are kept in memory for USER_CACHE_TTL seconds.
+# Claims older than USER_CLAIMS_MAX_AGE seconds are checked against the database, the
+# changes of the users are shared by the processes through the USER_CACHE_ALIAS cache.
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 1000
+USER_CACHE_ALIAS = 'user_changes'
+USER_CLAIMS_MAX_AGE = int(SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds())
+
 ROOT_URLCONF = 'epicevents.urls'
 
 TEMPLATES = [
@@ -91,6 +171,25 @@ DATABASES = {
     }
 }
 
+# Read replicas of 'default', e.g. DB_REPLICA_HOSTS=replica1,replica2: the reads
+# of GET requests go to one of them (see api.routers.ReplicaRouter). Locally,
+# DB_REPLICA_NAME points the replica to a second database of the same server.
+DATABASE_REPLICAS = []
+for i, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{i}'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{i}')
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# A client which wrote reads from the primary for REPLICA_PIN_SECONDS, longer
+# than the replication lag, so it sees its own writes.
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE_ALIAS = 'default'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators